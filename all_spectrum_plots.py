@@ -3,10 +3,13 @@
 import matplotlib.pyplot as plt
 import my_module
 
+database = my_module.load_database('spettri_categorie.csv')
+n_cols = 2
+n_rows = -(-len(database) // n_cols) # enough rows for all the categories
 plt.figure(figsize=(19, 11), dpi=100)
-for i in range(5):
-    plt.subplot(3, 2, i+1)
-    my_module.spectrum_plot('spettri_categorie.csv', i)
+for i in range(len(database)):
+    plt.subplot(n_rows, n_cols, i+1)
+    my_module.spectrum_plot(database, i)
 plt.tight_layout()
 plt.savefig('all_spectrum.png')
 plt.show()
@@ -0,0 +1,158 @@
+""" Arithmetic of 1/3 octave band spectra.
+All the functions work on whole matrices of levels (dB), e.g. shape
+(categories, bands), with the bands on the last axis, in one NumPy call.
+The bands are given with the labels of the spectrum files
+(e.g. '20 Hz', '1.25 kHz', also '100Hz'); a label that is not a frequency
+(as the broadband row '$L_{Aeq}$' or '$L_{W}$(A)') is not a band.
+
+The frequency weightings A, C and Z are precomputed tables for the 1/3
+octave bands from 10 Hz to 20 kHz, evaluated with the expressions of
+IEC 61672-1 at the exact base-10 midband frequencies 1000*10**(n/10) Hz.
+
+List of functions:
+- band_frequency(label)
+- band_label(n)
+- frequency_bands(bands)
+- weighting(bands, curve='A')
+- weight(levels, bands, curve='A')
+- band_sum(levels, axis=-1)
+- broadband(levels, bands, curve='A')
+- octave_regroup(levels, bands, partial=False)
+- recompute_broadband(database, curve='A')
+
+Author: Marco Nastasi
+"""
+
+import re
+import numpy as np
+
+_UNITS = {'': 1, 'k': 1e3}
+
+# band numbers n of the 1/3 octave bands (midband 1000*10**(n/10) Hz)
+_BAND_NUMBERS = np.arange(-20, 14) # 10 Hz ... 20 kHz
+
+def _a_curve(f):
+    """A-weighting (dB) at the frequencies f (Hz), IEC 61672-1."""
+    f2 = f**2
+    r_a = (12194**2 * f2**2
+           / ((f2 + 20.6**2)
+              * np.sqrt((f2 + 107.7**2) * (f2 + 737.9**2))
+              * (f2 + 12194**2)))
+    return 20*np.log10(r_a) + 2.00
+
+def _c_curve(f):
+    """C-weighting (dB) at the frequencies f (Hz), IEC 61672-1."""
+    f2 = f**2
+    r_c = 12194**2 * f2 / ((f2 + 20.6**2) * (f2 + 12194**2))
+    return 20*np.log10(r_c) + 0.06
+
+_MIDBAND = 1000 * 10**(_BAND_NUMBERS/10)
+WEIGHTING_TABLES = {
+    'A': dict(zip(_BAND_NUMBERS, _a_curve(_MIDBAND))),
+    'C': dict(zip(_BAND_NUMBERS, _c_curve(_MIDBAND))),
+    'Z': dict(zip(_BAND_NUMBERS, np.zeros(len(_BAND_NUMBERS)))),
+}
+
+# nominal frequencies of the bands n = 10*k + i, R10 preferred numbers
+_NOMINAL = (1, 1.25, 1.6, 2, 2.5, 3.15, 4, 5, 6.3, 8)
+
+def band_label(n):
+    """Return the nominal label of the band number n, in the format of the
+    database labels, e.g. 0 -> '1 kHz', -15 -> '31.5 Hz', 15 -> '31.5 kHz'.
+    """
+    frequency = _NOMINAL[n % 10] * 10.0**(n // 10 + 3)
+    if frequency >= 1000:
+        return f'{frequency/1000:g} kHz'
+    return f'{frequency:g} Hz'
+
+def band_frequency(label):
+    """Return the nominal frequency (Hz) of a band label,
+    e.g. '100 Hz' -> 100, '1.25 kHz' -> 1250, '100Hz' -> 100.
+    """
+    match = re.fullmatch(r'\s*([0-9.]+)\s*(k?)Hz\s*', str(label))
+    if match is None:
+        raise ValueError(f"not a frequency band label: {label!r}")
+    return float(match.group(1)) * _UNITS[match.group(2)]
+
+def _band_numbers(bands):
+    """Return the band numbers n of the band labels."""
+    frequencies = np.array([band_frequency(band) for band in bands])
+    return np.rint(10*np.log10(frequencies/1000)).astype(int)
+
+def frequency_bands(bands):
+    """Return a boolean mask of the labels in bands that are frequency
+    bands (e.g. False for the broadband row '$L_{Aeq}$').
+    """
+    mask = []
+    for band in bands:
+        try:
+            band_frequency(band)
+        except ValueError:
+            mask.append(False)
+        else:
+            mask.append(True)
+    return np.array(mask, dtype=bool)
+
+def weighting(bands, curve='A'):
+    """Return the weighting (dB) of the curve 'A', 'C' or 'Z' for each
+    band label, from the precomputed tables.
+    """
+    try:
+        table = WEIGHTING_TABLES[curve]
+    except KeyError:
+        raise ValueError(f"unknown weighting {curve!r}, use 'A', 'C' or 'Z'")
+    numbers = _band_numbers(bands)
+    missing = [band for band, n in zip(bands, numbers) if n not in table]
+    if missing:
+        raise ValueError(f"no {curve}-weighting for the bands {missing}")
+    return np.array([table[n] for n in numbers])
+
+def weight(levels, bands, curve='A'):
+    """Return the weighted levels (dB), levels + weighting(bands, curve)
+    on the last axis.
+    """
+    return np.asarray(levels, dtype=float) + weighting(bands, curve)
+
+def band_sum(levels, axis=-1):
+    """Return the energetic sum 10*log10(sum(10**(L/10))) of the levels
+    (dB) along axis.
+    """
+    levels = np.asarray(levels, dtype=float)
+    return 10*np.log10(np.sum(10**(levels/10), axis=axis))
+
+def broadband(levels, bands, curve='A'):
+    """Return the broadband level (dB) of the spectra in levels, e.g.
+    L_Aeq with curve='A': the energetic sum of the weighted bands.
+    """
+    return band_sum(weight(levels, bands, curve))
+
+def octave_regroup(levels, bands, partial=False):
+    """Regroup 1/3 octave spectra in octave spectra: each octave level is
+    the energetic sum of its three 1/3 octave bands.
+    Return (octave_levels, octave_labels), octave_levels has the shape of
+    levels with the octaves on the last axis.
+    - partial -- keep the octaves with less than three bands in bands
+    (default False, e.g. the 16 Hz octave of a spectrum from 20 Hz)
+    """
+    levels = np.asarray(levels, dtype=float)
+    numbers = _band_numbers(bands)
+    octaves = (numbers + 1) // 3 * 3 # band number of the central band
+    octave_numbers, counts = np.unique(octaves, return_counts=True)
+    if not partial:
+        octave_numbers = octave_numbers[counts == 3]
+    # (bands, octaves) matrix of 0/1, the sum is a matrix product
+    grouping = (octaves[:, None] == octave_numbers[None, :]).astype(float)
+    energies = 10**(levels/10) @ grouping
+    with np.errstate(divide='ignore'):
+        octave_levels = 10*np.log10(energies)
+    labels = np.array([band_label(n) for n in octave_numbers])
+    return octave_levels, labels
+
+def recompute_broadband(database, curve='A'):
+    """Return the broadband level (dB) of the mean spectrum of each
+    category of a my_module.SpectrumDatabase, from its frequency bands.
+    For energetic means this is the energetic mean of the broadband
+    levels of the measurements.
+    """
+    mask = frequency_bands(database.bands)
+    return broadband(database.mean[:, mask], database.bands[mask], curve)
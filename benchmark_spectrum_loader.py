@@ -0,0 +1,70 @@
+""" Benchmark of the column MultiIndex renaming of the spectrum database.
+Compare the old Python loop (one element of data.columns at a time, then
+set_axis which copies the frame) with my_module.read_spectrum_csv on a
+synthetic database with the same layout of spettri_categorie.csv.
+"""
+import os
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+import my_module
+
+n_categories = 10000
+n_repeat = 3
+
+def write_synthetic_database(outputfile, n_categories, seed=0):
+    """Write a synthetic spectrum database with n_categories categories
+    and the bands of spettri_categorie.csv.
+    """
+    bands = my_module.SpectrumDatabase.from_csv('spettri_categorie.csv').bands
+    rng = np.random.default_rng(seed)
+    values = np.empty((len(bands), 2*n_categories))
+    values[:, 0::2] = rng.uniform(30, 100, (len(bands), n_categories))
+    values[:, 1::2] = rng.uniform(1, 8, (len(bands), n_categories))
+    names = [f'category {j}' for j in range(n_categories)]
+    with open(outputfile, 'w') as f:
+        f.write(';' + ';'.join(f'{name};' for name in names) + '\n')
+        f.write(';' + ';'.join(['media;dev.std']*n_categories) + '\n')
+        for band, row in zip(bands, values):
+            f.write(band + ';' + ';'.join(f'{v:.1f}' for v in row) + '\n')
+
+def loop_renaming(data):
+    """Old renaming of the column MultiIndex (Python loop)."""
+    new_columns = []
+    for i in range(len(data.columns)):
+        if i % 2 == 0:
+            new_columns += (data.columns[i],)
+        else:
+            new_columns += [(data.columns[i-1][0], data.columns[i][1])]
+    return data.set_axis(new_columns, axis='columns')
+
+def best_time(func, *args):
+    """Return the best time (s) of n_repeat calls of func(*args)."""
+    times = []
+    for _ in range(n_repeat):
+        t1 = time.perf_counter()
+        func(*args)
+        t2 = time.perf_counter()
+        times.append(t2 - t1)
+    return min(times)
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as tmpdir:
+        inputfile = os.path.join(tmpdir, 'synthetic.csv')
+        write_synthetic_database(inputfile, n_categories)
+
+        raw = pd.read_csv(inputfile, sep=';', header=[0, 1], index_col=[0])
+        old = loop_renaming(raw)
+        new = my_module.read_spectrum_csv(inputfile)
+        assert old.columns.equals(new.columns)
+
+        t_read = best_time(my_module.read_spectrum_csv, inputfile)
+        t_loop = best_time(loop_renaming, raw)
+        t_vect = best_time(my_module._spectrum_columns, raw.columns)
+
+    print(f"synthetic database: {n_categories} categories")
+    print(f"read_spectrum_csv (read + renaming): {t_read*1000:.1f} ms")
+    print(f"loop renaming + set_axis: {t_loop*1000:.2f} ms")
+    print(f"vectorized renaming: {t_vect*1000:.2f} ms")
+    print(f"speedup of the renaming: {t_loop/t_vect:.0f}x")
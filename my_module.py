@@ -3,57 +3,433 @@ This module contains functions that I found useful.
 For now it's generic. Later it would be better to divide the functions
 in module with some shared context. For now this will serve.
 
+List of classes:
+- SpectrumDatabase(bands, categories, mean, std)
+- DatabaseCache(max_bytes=256*2**20)
+- SpectrumRecord(category, bands, mean, std)
+- SpectrumStream(inputfile, block_size=2**16)
+
 List of functions:
-- spectrum_plot(inputfile, category=0, xticks_step=3)
+- read_spectrum_csv(inputfile)
+- binary_cache_path(inputfile)
+- update_binary_cache(inputfile, dtype=np.float64)
+- load_database(inputfile)
+- spectrum_plot(inputfile, category=0, xticks_step=3, ax=None)
 
 Author: Marco Nastasi
 """
 
+import os
+import threading
+from collections import OrderedDict, deque, namedtuple
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 
-def spectrum_plot(inputfile, category=0, xticks_step=3):
+def read_spectrum_csv(inputfile):
+    """Read the ';' separated spectrum database inputfile and return a
+    pandas DataFrame with the frequency bands as index and a column
+    MultiIndex (category, statistic), e.g. ('RORO', 'media') and
+    ('RORO', 'dev.std').
+    The category names are in the first header row only above the mean
+    columns, the index is built in a single vectorized step and assigned
+    without copying the data.
+    """
+    data = pd.read_csv(inputfile,
+                       sep=';',
+                       header=[0, 1], # column MultiIndex with first 2 rows
+                       index_col=[0]) # first column as index
+
+    data.columns = _spectrum_columns(data.columns)
+    return data
+
+def _spectrum_columns(columns):
+    """Return the renamed column MultiIndex (category, statistic): each
+    dev.std column takes the category name of the mean column on its left.
+    """
+    names = columns.get_level_values(0).to_numpy()
+    statistics = columns.get_level_values(1)
+    return pd.MultiIndex.from_arrays(
+        [np.repeat(names[0::2], 2)[:len(names)], statistics])
+
+
+class SpectrumDatabase:
+    """Spectrum database parsed once and kept in memory.
+    The database is the ';' separated file with two header rows
+    (category name, then 'media'/'dev.std') and the frequency bands
+    as first column, as in spettri_categorie.csv.
+    - bands -- array of the band labels (first row is the broadband level)
+    - categories -- array of the category names
+    - mean -- contiguous array of mean values, shape (categories, bands)
+    - std -- contiguous array of dev.std values, shape (categories, bands)
+    Use SpectrumDatabase.from_csv(inputfile) to read a file, save_binary
+    and load_binary to write and read the binary (.npy) format.
+    """
+
+    def __init__(self, bands, categories, mean, std):
+        self.bands = np.asarray(bands)
+        self.categories = np.asarray(categories)
+        self.mean = np.ascontiguousarray(mean)
+        self.std = np.ascontiguousarray(std)
+
+    @classmethod
+    def from_csv(cls, inputfile):
+        """Read the .csv database inputfile and return a SpectrumDatabase."""
+        data = read_spectrum_csv(inputfile)
+        values = data.to_numpy(dtype=float)
+        # even columns contain mean values, odd columns dev.std values
+        return cls(bands=data.index.to_numpy(dtype=str),
+                   categories=data.columns.get_level_values(0)[0::2]
+                                  .to_numpy(dtype=str),
+                   mean=values[:, 0::2].T,
+                   std=values[:, 1::2].T)
+
+    @classmethod
+    def load_binary(cls, inputdir, mmap_mode='r'):
+        """Read a database written by save_binary in the inputdir
+        directory. The mean and dev.std arrays are memory-mapped with
+        np.load(mmap_mode=mmap_mode) (None to load them in memory).
+        """
+        def load(name, mmap_mode=None):
+            return np.load(os.path.join(inputdir, name + '.npy'),
+                           mmap_mode=mmap_mode, allow_pickle=False)
+
+        return cls(bands=load('bands'),
+                   categories=load('categories'),
+                   mean=load('mean', mmap_mode),
+                   std=load('std', mmap_mode))
+
+    def save_binary(self, outputdir, dtype=np.float64):
+        """Write the database in the outputdir directory, one .npy file
+        for each of bands, categories, mean and std.
+        - dtype -- type of the mean and std arrays (np.float32 halves the
+        size of the files, default np.float64)
+        Each file is written aside and then renamed, so a reader never
+        sees a partial file.
+        """
+        os.makedirs(outputdir, exist_ok=True)
+        arrays = {'bands': self.bands,
+                  'categories': self.categories,
+                  'mean': self.mean.astype(dtype, copy=False),
+                  'std': self.std.astype(dtype, copy=False)}
+        for name, array in arrays.items():
+            path = os.path.join(outputdir, name + '.npy')
+            with open(path + '.tmp', 'wb') as f:
+                np.save(f, array, allow_pickle=False)
+            os.replace(path + '.tmp', path)
+
+    def to_csv(self, outputfile, float_format='{:.1f}'):
+        """Write the database in outputfile with the ';' separated layout
+        read by from_csv (two header rows, bands as first column).
+        - float_format -- format of the values (default '{:.1f}')
+        """
+        with open(outputfile, 'w') as f:
+            f.write(';' + ''.join(f'{name};;' for name in self.categories)
+                    [:-1] + '\n')
+            f.write(';' + ';'.join(['media;dev.std']*len(self)) + '\n')
+            for i, band in enumerate(self.bands):
+                values = np.empty(2*len(self))
+                values[0::2] = self.mean[:, i]
+                values[1::2] = self.std[:, i]
+                f.write(band + ';'
+                        + ';'.join(float_format.format(v) for v in values)
+                        + '\n')
+
+    def __len__(self):
+        return len(self.categories)
+
+    @property
+    def nbytes(self):
+        """Memory used by the arrays of the database (bytes)."""
+        return (self.bands.nbytes + self.categories.nbytes
+                + self.mean.nbytes + self.std.nbytes)
+
+    def category(self, j):
+        """Return (name, mean, std) of the category with index j."""
+        return self.categories[j], self.mean[j], self.std[j]
+
+    def record(self, j):
+        """Return the SpectrumRecord of the category with index j."""
+        return SpectrumRecord(self.categories[j], self.bands,
+                              self.mean[j], self.std[j])
+
+    def __iter__(self):
+        """Iterate over the SpectrumRecord of all the categories."""
+        return (self.record(j) for j in range(len(self)))
+
+
+class DatabaseCache:
+    """Process-wide LRU cache of the parsed spectrum databases.
+    Entries are keyed on the absolute path of the file and validated
+    against its size and modification time, so a changed file is parsed
+    again. The least recently used databases are evicted when the total
+    memory exceeds max_bytes.
+    - max_bytes -- memory cap of the cached arrays (default 256 MiB)
+    The hits and misses attributes count the lookups.
+    """
+
+    def __init__(self, max_bytes=256*2**20):
+        self._entries = OrderedDict() # path -> (size, mtime, database)
+        self._lock = threading.Lock()
+        self._max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def max_bytes(self):
+        """Memory cap of the cache (bytes), setting it evicts if needed."""
+        return self._max_bytes
+
+    @max_bytes.setter
+    def max_bytes(self, value):
+        with self._lock:
+            self._max_bytes = value
+            self._evict()
+
+    @property
+    def nbytes(self):
+        """Memory currently used by the cached databases (bytes)."""
+        return sum(entry[2].nbytes for entry in self._entries.values())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, inputfile):
+        """Return the SpectrumDatabase of inputfile, parsing the file
+        only if it is not cached or it changed since it was cached.
+        """
+        path = os.path.abspath(inputfile)
+        st = os.stat(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[:2] == (st.st_size, st.st_mtime_ns):
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+            self._entries.pop(path, None) # stale entry, file changed
+        # parse outside the lock, other threads can use the cache meanwhile
+        if _binary_cache_is_fresh(path, st.st_mtime_ns):
+            database = SpectrumDatabase.load_binary(binary_cache_path(path))
+        else:
+            database = SpectrumDatabase.from_csv(path)
+        with self._lock:
+            if database.nbytes <= self._max_bytes:
+                self._entries[path] = (st.st_size, st.st_mtime_ns, database)
+                self._evict()
+        return database
+
+    def clear(self):
+        """Empty the cache and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        """Return a dict with hits, misses, entries, nbytes, max_bytes."""
+        with self._lock:
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "entries": len(self._entries),
+                    "nbytes": self.nbytes,
+                    "max_bytes": self._max_bytes}
+
+    def _evict(self):
+        """Drop the least recently used entries until under max_bytes."""
+        nbytes = self.nbytes
+        while self._entries and nbytes > self._max_bytes:
+            _, (_, _, database) = self._entries.popitem(last=False)
+            nbytes -= database.nbytes
+
+
+def binary_cache_path(inputfile):
+    """Return the directory of the binary cache of the .csv inputfile
+    (e.g. spettri_categorie.csv -> spettri_categorie.npcache).
+    """
+    return os.path.splitext(inputfile)[0] + '.npcache'
+
+def _binary_cache_is_fresh(inputfile, mtime_ns):
+    """Check that all the files of the binary cache of inputfile exist
+    and are newer than mtime_ns (modification time of inputfile).
+    """
+    cachedir = binary_cache_path(inputfile)
+    try:
+        return all(os.stat(os.path.join(cachedir, name + '.npy')).st_mtime_ns
+                   >= mtime_ns
+                   for name in ('bands', 'categories', 'mean', 'std'))
+    except FileNotFoundError:
+        return False
+
+def _binary_cache_dtype(cachedir):
+    """Return the dtype of the mean and std arrays of the binary cache in
+    cachedir (read from the header of mean.npy only).
+    """
+    return np.load(os.path.join(cachedir, 'mean.npy'), mmap_mode='r').dtype
+
+def update_binary_cache(inputfile, dtype=np.float64):
+    """Write the binary cache of the .csv inputfile if it is missing,
+    older than inputfile or of a dtype other than dtype (None for any
+    dtype, float64 if written), then return its directory.
+    Once written, load_database and spectrum_plot use it automatically.
+    """
+    cachedir = binary_cache_path(inputfile)
+    if (not _binary_cache_is_fresh(inputfile, os.stat(inputfile).st_mtime_ns)
+        or (dtype is not None
+            and _binary_cache_dtype(cachedir) != np.dtype(dtype))):
+        SpectrumDatabase.from_csv(inputfile).save_binary(
+            cachedir, np.float64 if dtype is None else dtype)
+    return cachedir
+
+
+database_cache = DatabaseCache()
+
+def load_database(inputfile):
+    """Return the SpectrumDatabase of the .csv inputfile using the
+    process-wide database_cache (see DatabaseCache). The binary cache
+    (see update_binary_cache) is used instead of parsing the file when
+    it is newer than inputfile.
+    """
+    return database_cache.get(inputfile)
+
+
+# spectrum of a single category, bands is shared by all the records
+SpectrumRecord = namedtuple('SpectrumRecord',
+                            ['category', 'bands', 'mean', 'std'])
+
+class _LineFields:
+    """Read the ';' separated fields of one line of a binary file, one
+    block at a time, from the byte offset start to end (newline excluded).
+    Many _LineFields can share the same file, each one seeks its position.
+    """
+
+    def __init__(self, f, start, end, block_size):
+        self.f = f
+        self.pos = start
+        self.end = end
+        self.block_size = block_size
+        self.fields = deque()
+        self.tail = b'' # incomplete field at the end of the last block
+
+    def next(self):
+        """Return the next field (str), None at the end of the line."""
+        while not self.fields:
+            if self.pos >= self.end:
+                if self.tail is None:
+                    return None
+                self.fields.append(self.tail.rstrip(b'\r'))
+                self.tail = None
+                break
+            self.f.seek(self.pos)
+            block = self.f.read(min(self.block_size, self.end - self.pos))
+            self.pos += len(block)
+            parts = (self.tail + block).split(b';')
+            self.tail = parts.pop()
+            self.fields.extend(parts)
+        return self.fields.popleft().decode()
+
+    def next_float(self):
+        """Return the next field as float (nan if empty)."""
+        field = self.next()
+        return float(field) if field else np.nan
+
+
+class SpectrumStream:
+    """Streaming reader of a spectrum database in the format of
+    read_spectrum_csv, for files too big to be loaded in memory.
+    Iterating over it yields one SpectrumRecord for each category, in the
+    order of the file, reading every line of the file in parallel a block
+    at a time: the memory used depends on the number of bands and on
+    block_size, not on the number of categories.
+    - inputfile -- the .csv database
+    - block_size -- bytes read at a time from each line (default 64 KiB)
+    The bands attribute contains the band labels (first column).
+    """
+
+    def __init__(self, inputfile, block_size=2**16):
+        self.inputfile = inputfile
+        self.block_size = block_size
+        self.line_offsets = self._index_lines()
+        self.bands = np.array([self._first_field(start, end)
+                               for start, end in self.line_offsets[2:]])
+
+    def _index_lines(self):
+        """Return the (start, end) byte offsets of the non empty lines."""
+        offsets = []
+        start = 0
+        pos = 0
+        with open(self.inputfile, 'rb') as f:
+            for block in iter(lambda: f.read(self.block_size), b''):
+                newline = block.find(b'\n')
+                while newline >= 0:
+                    offsets.append((start, pos + newline))
+                    start = pos + newline + 1
+                    newline = block.find(b'\n', newline + 1)
+                pos += len(block)
+        offsets.append((start, pos))
+        return [(start, end) for start, end in offsets
+                if end - start > 1] # skip empty lines ('' or '\r')
+
+    def _first_field(self, start, end):
+        """Return the first field of the line between start and end."""
+        with open(self.inputfile, 'rb') as f:
+            return _LineFields(f, start, end, self.block_size).next()
+
+    def __iter__(self):
+        with open(self.inputfile, 'rb') as f:
+            lines = [_LineFields(f, start, end, self.block_size)
+                     for start, end in self.line_offsets]
+            for line in lines: # skip the first column
+                line.next()
+            names, statistics, bands = lines[0], lines[1], lines[2:]
+            while True:
+                name = names.next()
+                if name is None:
+                    return
+                names.next() # empty name above the dev.std column
+                if (statistics.next(), statistics.next()) == (None, None):
+                    raise ValueError(f"{self.inputfile}: missing statistic "
+                                     f"columns for category {name}")
+                mean = np.empty(len(bands))
+                std = np.empty(len(bands))
+                for i, line in enumerate(bands):
+                    mean[i] = line.next_float()
+                    std[i] = line.next_float()
+                yield SpectrumRecord(name, self.bands, mean, std)
+
+
+def spectrum_plot(inputfile, category=0, xticks_step=3, ax=None):
     """Read the inputfile of leq and spectrum and return a bar plot with
     errorbars of the selected category.
-    - inputfile -- is the .csv file containing the database
+    - inputfile -- is the .csv file containing the database, an already
+    loaded SpectrumDatabase or a single SpectrumRecord (e.g. from a
+    SpectrumStream, category is then ignored). Files are read through
+    load_database, so repeated calls on the same unchanged file parse it
+    only once
     - category -- is an index used to select the category corresponding
     to the chosen column (default 0)
     (es: for Traghetto category input category=4).
     - xticks_step -- select the step of the ticks in the x axis of the
     plot (default=3)
+    - ax -- matplotlib Axes where to draw the plot (default None, the
+    current Axes of pyplot)
     Requires: pandas, numpy, matplotlib.
     """
-    data = pd.read_csv(inputfile,
-                       sep=';',
-                       header=[0, 1], # column MultiIndex with first 2 rows
-                       index_col=[0]) # first column as index
+    if isinstance(inputfile, SpectrumRecord):
+        record = inputfile
+    elif isinstance(inputfile, SpectrumDatabase):
+        record = inputfile.record(category)
+    else:
+        record = load_database(inputfile).record(category)
 
-    # renaming column MultiIndex
-    new_columns = []
-    for i in range(len(data.columns)):
-        if i % 2 == 0:
-            new_columns += (data.columns[i],)
-        else:
-            new_columns += [(data.columns[i-1][0], data.columns[i][1])]
-    data.set_axis(new_columns, axis='columns', inplace=True)
-
-    # Selecting even columns from DataFrame (containing mean values)
-    even_col = data[data.columns[0::2]]
-    # Selecting odd columns from DataFrame (containing dev.std values)
-    odd_col = data[data.columns[1::2]]
-
-    # choosing a column (category) and preparing data into np.arrays
-    j_col = category # used on the reduced DataFrame even_col and odd_col
-    chosen_col = even_col[even_col.columns[j_col]] # 1 column pandas DataFrame
-    x_data = np.array(chosen_col.index)
-    y_data = chosen_col.values
-    y_errors = odd_col.values[:, j_col]
+    # choosing a category and preparing data into np.arrays
+    name, x_data, y_data, y_errors = record
 
     # making a plot of chosen column (category)
     # plt.figure()
     # fig, ax = plt.subplots()
-    ax = plt.gca()
+    if ax is None:
+        ax = plt.gca()
     spectrum_plt = ax.bar(x_data, y_data, yerr=y_errors, capsize=5)
     # leq_plt = ax.bar(x_data[0], y_data[0], yerr=y_errors[0], capsize=5)
     leq_plt = ax.bar(x_data[0], y_data[0])
@@ -61,13 +437,13 @@ def spectrum_plot(inputfile, category=0, xticks_step=3):
     #            ('1/3 octave bands', '$L_{Aeq}$ (dB(A))'))
     ax.legend((spectrum_plt, leq_plt),
               ('1/3 octave bands', 'broadband level (dB(A))'))
-    plot_title = f'Sound pressure spectrum - category: {chosen_col.name[0]}'
+    plot_title = f'Sound pressure spectrum - category: {name}'
     ax.set_title(plot_title)
     ax.set_xlabel('Frequency bands (Hz)')
     ax.set_ylabel('Sound pressure level (dB)')
     # selecting a subset of ticks for x axes of the plot
-    new_xticks = np.arange(0, len(even_col.index)-1, step=xticks_step)
-    new_xticks_labels = [even_col.index[new_xticks][i].replace("Hz", "")
+    new_xticks = np.arange(0, len(x_data)-1, step=xticks_step)
+    new_xticks_labels = [x_data[new_xticks][i].replace("Hz", "")
                          for i in range(len(new_xticks))]
     ax.set_xticks(new_xticks)
     ax.set_xticklabels(new_xticks_labels)
@@ -80,7 +456,7 @@ def spectrum_plot(inputfile, category=0, xticks_step=3):
             height = rect.get_height()
             x = rect.get_x() + rect.get_width() / 2
             y = height + voffset[i]
-            ax.annotate('{}'.format(height),
+            ax.annotate(str(y_data[i]), # str of the NumPy scalar
                         xy=(x, y),
                         xytext=(0, 0.5),  # 0.5 points vertical offset
                         textcoords="offset points",
@@ -93,3 +469,17 @@ def spectrum_plot(inputfile, category=0, xticks_step=3):
 
     # plt.show()
     # plt.ion(); plt.show()
+
+
+if __name__ == '__main__':
+    # write the binary cache of the given .csv databases
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Write the binary (.npy) cache of spectrum databases.")
+    parser.add_argument('inputfiles', nargs='+', help=".csv databases")
+    parser.add_argument('--float32', action='store_true',
+                        help="store mean and dev.std as float32")
+    args = parser.parse_args()
+    for inputfile in args.inputfiles:
+        dtype = np.float32 if args.float32 else np.float64
+        print(update_binary_cache(inputfile, dtype))
@@ -11,10 +11,11 @@ font_size = 12 # for title, xlabel and ylabel
 ticks_font_size = 9 # for ticks labels
 
 y_limits = (0, 115)
+database = my_module.load_database(input_file) # parse only once
 # plt.ion()
-for i in range(5):
+for i in range(len(database)):
     plt.figure(figsize=fig_size, dpi=100)
-    my_module.spectrum_plot(input_file, i)
+    my_module.spectrum_plot(database, i)
     ax = plt.gca()
     plot_title = ax.get_title().replace('pressure', 'power')
     ax.set_title(plot_title, fontweight='bold', fontsize=font_size)
@@ -1,21 +1,10 @@
-import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
+import my_module
 # import string
 
-data = pd.read_csv('spettri_categorie.csv',
-                     sep=';',
-                     header=[0,1], # column MultiIndex with first 2 rows
-                     index_col=[0]) # first column as index
-
-# renaming column MultiIndex
-new_columns = []
-for i in range(len(data.columns)):
-    if i % 2 == 0:
-        new_columns += (data.columns[i],)
-    else:
-        new_columns += [(data.columns[i-1][0], data.columns[i][1])]
-data.set_axis(new_columns, axis='columns', inplace=True)
+# column MultiIndex (category, statistic)
+data = my_module.read_spectrum_csv('spettri_categorie.csv')
 
 # Selecting even columns from DataFrame (containing mean values)
 even_col = data[data.columns[0::2]]
@@ -0,0 +1,322 @@
+""" Render the spectrum plot of many categories, each in a separated
+figure file, in parallel across processes.
+The figures are drawn on matplotlib Figure objects (no pyplot, no GUI),
+so they are rendered headless with the Agg backend (PNG) or the PDF
+backend. A .csv database is parsed once into its binary cache
+(my_module.update_binary_cache), which every worker process memory-maps
+instead of receiving a copy, or it is streamed one category at a time
+with my_module.SpectrumStream (--stream) when it is too big for memory.
+
+Command line usage:
+    python spectrum_batch.py power_spectra.csv --style power
+    python spectrum_batch.py spettri_categorie.csv -c 0 3 -f pdf -o plots
+    python spectrum_batch.py big_database.csv --stream -o plots
+
+List of classes:
+- SpectrumFigure(record, style='pressure', fig_size=(8, 4), dpi=100)
+
+List of functions:
+- render_record(record, output_file, style='pressure', fig_size=(8, 4),
+  dpi=100)
+- render_category(database, category, output_file, style='pressure',
+  fig_size=(8, 4), dpi=100)
+- render_spectra(inputfile, categories=None, output_dir='.', fmt='png',
+  style='pressure', workers=None, fig_size=(8, 4), dpi=100,
+  reuse_figure=True)
+
+Author: Marco Nastasi
+"""
+
+import argparse
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from matplotlib.figure import Figure
+import my_module
+
+# output_file name, index is the category index + 1
+NAME_FORMAT = 'spectrum {index:02d}.{fmt}'
+
+# same layout of power_spectra_plot.py
+POWER_STYLE = {
+    'font_size': 12, # for title, xlabel and ylabel
+    'ticks_font_size': 9, # for ticks labels
+    'y_limits': (0, 115),
+}
+
+def style_power_plot(ax):
+    """Turn the sound pressure plot on ax into a sound power plot with the
+    layout of power_spectra_plot.py.
+    """
+    font_size = POWER_STYLE['font_size']
+    plot_title = ax.get_title().replace('pressure', 'power')
+    ax.set_title(plot_title, fontweight='bold', fontsize=font_size)
+    ax.set_ylabel('$L_{W/m}$ (dB)', fontsize=font_size)
+    ax.set_xlabel('Frequency bands (Hz)', fontsize=font_size)
+    ax.margins(0.01)
+    ax.tick_params(labelsize=POWER_STYLE['ticks_font_size'])
+    ax.set_ylim(POWER_STYLE['y_limits'])
+
+def _save(fig, output_file):
+    """Save fig in output_file, without the PDF creation date."""
+    if output_file.endswith('.pdf'):
+        metadata = {'CreationDate': None}
+    else:
+        metadata = None
+    fig.savefig(output_file, metadata=metadata)
+
+def render_record(record, output_file, style='pressure', fig_size=(8, 4),
+                  dpi=100):
+    """Draw the spectrum plot of a my_module.SpectrumRecord in a new
+    Figure and save it in output_file.
+    - style -- 'pressure' for the plot of my_module.spectrum_plot,
+    'power' for the layout of power_spectra_plot.py
+    The output is deterministic: the same call gives the same bytes in any
+    process (the PDF creation date is not written).
+    """
+    fig = Figure(figsize=fig_size, dpi=dpi)
+    ax = fig.add_subplot()
+    my_module.spectrum_plot(record, ax=ax)
+    if style == 'power':
+        style_power_plot(ax)
+    fig.tight_layout()
+    _save(fig, output_file)
+    return output_file
+
+def render_category(database, category, output_file, style='pressure',
+                    fig_size=(8, 4), dpi=100):
+    """Draw the spectrum plot of a category of the database (a
+    SpectrumDatabase) in a new Figure and save it in output_file.
+    See render_record.
+    """
+    return render_record(database.record(category), output_file,
+                         style=style, fig_size=fig_size, dpi=dpi)
+
+
+class SpectrumFigure:
+    """Template figure to render many categories with the same bands.
+    The axes, bars, errorbars, legend and annotations are created once
+    by my_module.spectrum_plot; for each category render() only updates
+    the bar heights, the errorbar segments, the annotations and the title,
+    then saves the figure. The images are the same of render_record.
+    - record -- SpectrumRecord used to build the template
+    - style, fig_size, dpi -- see render_record
+    """
+
+    def __init__(self, record, style='pressure', fig_size=(8, 4), dpi=100):
+        self.style = style
+        self.fig = Figure(figsize=fig_size, dpi=dpi)
+        self.ax = self.fig.add_subplot()
+        # tight_layout starts from the default subplot parameters, keep them
+        # to restart from the same layout (and get the same output) each time
+        params = self.fig.subplotpars
+        self.subplot_params = {name: getattr(params, name) for name in
+                               ('left', 'bottom', 'right', 'top')}
+        my_module.spectrum_plot(record, ax=self.ax)
+        if style == 'power':
+            style_power_plot(self.ax)
+        # artists created by spectrum_plot
+        errorbar, self.bars, leq_bar = self.ax.containers[:3]
+        self.leq_rect = leq_bar.patches[0]
+        _, (self.low_caps, self.high_caps), (self.segments,) = errorbar.lines
+        self.x = np.asarray(self.low_caps.get_xdata(), dtype=float)
+        self.labels = self.ax.texts
+        # title text before the category name
+        title = self.ax.get_title()
+        self.title_prefix = title[:len(title) - len(record.category)]
+
+    def render(self, record, output_file):
+        """Draw the SpectrumRecord on the template figure, save it in
+        output_file and return output_file.
+        """
+        name, _, y_data, y_errors = record
+        if len(y_data) != len(self.bars):
+            raise ValueError(f"category {name} has {len(y_data)} bands, "
+                             f"the template figure {len(self.bars)}")
+        heights = np.asarray(y_data, dtype=float)
+        low = heights - y_errors
+        high = heights + y_errors
+        for rect, height in zip(self.bars.patches, heights):
+            rect.set_height(height)
+        self.leq_rect.set_height(heights[0])
+        self.low_caps.set_ydata(low)
+        self.high_caps.set_ydata(high)
+        self.segments.set_segments(
+            np.stack([np.column_stack([self.x, low]),
+                      np.column_stack([self.x, high])], axis=1))
+        for i, (label, rect) in enumerate(zip(self.labels,
+                                              self.bars.patches)):
+            label.set_text(str(y_data[i]))
+            label.xy = (label.xy[0], rect.get_height() + y_errors[i])
+        self.ax.title.set_text(self.title_prefix + name)
+        # autoscale on the new data (fixed y limits are kept)
+        self.ax.relim()
+        self.ax.autoscale_view()
+        self.fig.subplots_adjust(**self.subplot_params)
+        self.fig.tight_layout()
+        _save(self.fig, output_file)
+        return output_file
+
+# database of the worker process, set once by _init_worker
+_worker_database = None
+# template figures of the worker process, one for each set of options
+_worker_figures = {}
+
+def _init_worker(database):
+    """Store the database shared by all the tasks of a worker process:
+    a SpectrumDatabase, or the directory of a binary cache, memory-mapped
+    here (the values are not copied in each process).
+    """
+    global _worker_database
+    if isinstance(database, (str, os.PathLike)):
+        database = my_module.SpectrumDatabase.load_binary(database)
+    _worker_database = database
+    _worker_figures.clear()
+
+def _renderer(options, reuse_figure, figures):
+    """Return a function (record, output_file) -> output_file, using
+    the SpectrumFigure in figures for options if reuse_figure is True
+    (the template is built on the first record rendered).
+    """
+    if not reuse_figure:
+        return lambda record, output_file: render_record(
+            record, output_file, **options)
+    key = tuple(sorted(options.items()))
+
+    def render(record, output_file):
+        if key not in figures:
+            figures[key] = SpectrumFigure(record, **options)
+        return figures[key].render(record, output_file)
+
+    return render
+
+def _render_task(task):
+    """Render a chunk of (category, output_file) in a worker, category is
+    an index of the worker database or a SpectrumRecord.
+    """
+    jobs, options, reuse_figure = task
+    render = _renderer(options, reuse_figure, _worker_figures)
+    return [render(_worker_database.record(category)
+                   if isinstance(category, (int, np.integer)) else category,
+                   output_file)
+            for category, output_file in jobs]
+
+def _chunks(jobs, chunksize):
+    """Split the iterable jobs in lists of chunksize jobs."""
+    chunk = []
+    for job in jobs:
+        chunk.append(job)
+        if len(chunk) == chunksize:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def render_spectra(inputfile, categories=None, output_dir='.', fmt='png',
+                   style='pressure', workers=None, fig_size=(8, 4),
+                   dpi=100, reuse_figure=True, chunksize=8):
+    """Render the spectrum plot of the selected categories, each one in
+    output_dir/'spectrum NN.fmt', and return the list of output files.
+    - inputfile -- .csv database (its binary cache is written if missing
+    or stale and memory-mapped by the workers), an already loaded
+    SpectrumDatabase (sent to each worker) or a SpectrumStream (any
+    iterable of SpectrumRecord): records are then read one at a time and
+    sent to the workers in chunks, with a bounded number of chunks in
+    flight, so memory does not grow with the database
+    - categories -- indices of the categories (default None, all)
+    - fmt -- 'png' or 'pdf'
+    - style -- see render_record
+    - workers -- number of worker processes (default None, one for each
+    CPU); workers=1 (or a single category of a database) renders serially
+    in this process, with the same output
+    - reuse_figure -- draw on a SpectrumFigure template instead of a new
+    figure for each category (default True, same output, faster)
+    - chunksize -- number of figures sent to a worker at a time
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    shared = None # what _init_worker receives
+    if isinstance(inputfile, my_module.SpectrumDatabase):
+        database = shared = inputfile
+    elif isinstance(inputfile, (str, os.PathLike)):
+        if workers == 1:
+            database = my_module.load_database(inputfile)
+        else: # parsed once, memory-mapped by every process
+            shared = my_module.update_binary_cache(inputfile, dtype=None)
+            database = my_module.SpectrumDatabase.load_binary(shared)
+    else: # stream of records
+        database = None
+    os.makedirs(output_dir, exist_ok=True)
+
+    def output_file(j):
+        return os.path.join(output_dir, NAME_FORMAT.format(index=j+1, fmt=fmt))
+
+    if database is not None:
+        if categories is None:
+            categories = range(len(database))
+        jobs = [(j, output_file(j)) for j in categories]
+    else:
+        selected = None if categories is None else set(categories)
+        jobs = ((record, output_file(j))
+                for j, record in enumerate(inputfile)
+                if selected is None or j in selected)
+
+    options = {'style': style, 'fig_size': fig_size, 'dpi': dpi}
+    if workers == 1 or (database is not None and len(jobs) <= 1):
+        render = _renderer(options, reuse_figure, {})
+        return [render(database.record(category)
+                       if database is not None else category, output_file)
+                for category, output_file in jobs]
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=_init_worker,
+                             initargs=(shared,)) as executor:
+        pending = deque()
+        for chunk in _chunks(jobs, chunksize):
+            pending.append(executor.submit(_render_task,
+                                           (chunk, options, reuse_figure)))
+            if len(pending) >= 2*workers: # bound the records in flight
+                results.extend(pending.popleft().result())
+        while pending:
+            results.extend(pending.popleft().result())
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Render the spectrum plot of each category.")
+    parser.add_argument('inputfile', help=".csv database")
+    parser.add_argument('-c', '--categories', type=int, nargs='+',
+                        help="indices of the categories (default all)")
+    parser.add_argument('-o', '--output-dir', default='.',
+                        help="output directory (default .)")
+    parser.add_argument('-f', '--format', choices=('png', 'pdf'),
+                        default='png', help="output format (default png)")
+    parser.add_argument('-s', '--style', choices=('pressure', 'power'),
+                        default='pressure', help="plot layout")
+    parser.add_argument('-j', '--workers', type=int,
+                        help="worker processes (default one for each CPU)")
+    parser.add_argument('--dpi', type=float, default=100,
+                        help="resolution of the figures (default 100)")
+    parser.add_argument('--stream', action='store_true',
+                        help="read the database one category at a time "
+                             "(constant memory)")
+    parser.add_argument('--new-figures', action='store_true',
+                        help="create a new figure for each category "
+                             "instead of reusing a template figure")
+    args = parser.parse_args()
+    if args.stream:
+        inputfile = my_module.SpectrumStream(args.inputfile)
+    else:
+        inputfile = args.inputfile
+    output_files = render_spectra(inputfile,
+                                  categories=args.categories,
+                                  output_dir=args.output_dir,
+                                  fmt=args.format,
+                                  style=args.style,
+                                  workers=args.workers,
+                                  dpi=args.dpi,
+                                  reuse_figure=not args.new_figures)
+    print(f"{len(output_files)} figures written in {args.output_dir}")
@@ -0,0 +1,248 @@
+""" Aggregation of measured 1/3 octave spectra in category spectra.
+Each measurement is a row of sound levels (dB), one for each 1/3 octave
+band, labelled with the category of the source (e.g. the ship type).
+For each category and band the engine computes the energetic mean
+10*log10(mean(10**(L/10))), the arithmetic mean and the standard deviation
+of the levels, and the same statistics of the broadband level of the
+measurements (A-weighted energetic sum of the bands, as L_Aeq or L_W(A),
+see band_math).
+The result is a my_module.SpectrumDatabase, that can be plotted or written
+in the format of spettri_categorie.csv with its to_csv method.
+
+Measurements can be added in batches: SpectrumAggregator keeps, for each
+category and band, the running (Welford) count, mean and M2 of the levels
+and of the energies, so a new batch is reduced with NumPy and merged in
+O(batch) without the old measurements. The accumulators can be saved and
+loaded to keep them between runs.
+
+List of classes:
+- SpectrumAggregator(bands, broadband_label='$L_{Aeq}$', weighting='A')
+
+List of functions:
+- energetic_mean(levels, axis=0)
+- aggregate(categories, levels, bands, broadband_label='$L_{Aeq}$',
+  weighting='A', mean='energetic')
+
+Author: Marco Nastasi
+"""
+
+import numpy as np
+import band_math
+import my_module
+
+def energetic_mean(levels, axis=0):
+    """Return the energetic mean 10*log10(mean(10**(L/10))) of levels (dB)
+    along axis.
+    """
+    levels = np.asarray(levels, dtype=float)
+    return 10*np.log10(np.mean(10**(levels/10), axis=axis))
+
+
+def _slice_stats(x, starts, count):
+    """Return the mean and M2 (sum of the squared deviations from the
+    mean) of the rows of x in the slices [starts[j], starts[j] + count[j]),
+    shape (len(count), x.shape[1]).
+    """
+    mean = np.empty((len(count), x.shape[1]))
+    m2 = np.empty_like(mean)
+    for j, (start, n) in enumerate(zip(starts, count)):
+        block = x[start:start + n]
+        mean[j] = block.sum(axis=0) / n
+        deviation = block - mean[j]
+        m2[j] = np.einsum('ij,ij->j', deviation, deviation)
+    return [mean, m2]
+
+
+class SpectrumAggregator:
+    """Incremental aggregation of measured spectra by category.
+    - bands -- labels of the 1/3 octave bands of the measurements
+    (e.g. '20 Hz', ..., '20 kHz')
+    - broadband_label -- label of the broadband row of the output
+    (default '$L_{Aeq}$', e.g. '$L_{W}$(A)' for sound power)
+    - weighting -- weighting of the broadband level, 'A' (default), 'C'
+    or 'Z' (none), see band_math
+    Use add(categories, levels) for each batch of measurements, then
+    database() to get the category spectra at any time.
+    For each category and band (column 0 is the broadband level) the
+    accumulators are Welford's count, mean and M2 (sum of the squared
+    deviations from the mean) of the levels (dB) and of the energies
+    10**(L/10). A batch is reduced to the same accumulators and merged
+    with the pairwise formulas of Chan et al., in O(batch) time and
+    without the cancellation of the sums of squares. The state is saved
+    and loaded with save(outputfile) and SpectrumAggregator.load(inputfile).
+    """
+
+    _ACCUMULATORS = ('count', 'level_mean', 'level_m2',
+                     'energy_mean', 'energy_m2')
+
+    def __init__(self, bands, broadband_label='$L_{Aeq}$', weighting='A'):
+        self.bands = np.asarray(bands)
+        self.broadband_label = broadband_label
+        self.weights = band_math.weighting(self.bands, weighting)
+        self.weighting = weighting
+        self.categories = [] # in order of first appearance
+        self._rows = {} # category -> row of the accumulators
+        # accumulators (categories, 1 + bands), column 0 is the broadband
+        n_columns = 1 + len(self.bands)
+        self.count = np.zeros(0, dtype=np.int64)
+        self.level_mean = np.zeros((0, n_columns))
+        self.level_m2 = np.zeros((0, n_columns))
+        self.energy_mean = np.zeros((0, n_columns))
+        self.energy_m2 = np.zeros((0, n_columns))
+
+    def _category_rows(self, categories):
+        """Return the accumulator row of the unique names in categories
+        and the index of each measurement in the unique names, adding the
+        new categories.
+        """
+        names, first, inverse = np.unique(np.asarray(categories, dtype=str),
+                                          return_index=True,
+                                          return_inverse=True)
+        new = [name for name in names[np.argsort(first)]
+               if name not in self._rows]
+        for name in new:
+            self._rows[name] = len(self.categories)
+            self.categories.append(name)
+        if new:
+            for name in self._ACCUMULATORS:
+                acc = getattr(self, name)
+                setattr(self, name, np.concatenate(
+                    [acc, np.zeros((len(new),) + acc.shape[1:], acc.dtype)]))
+        rows = np.array([self._rows[name] for name in names], dtype=np.intp)
+        return rows, inverse.ravel()
+
+    def _merge(self, rows, count, level_mean, level_m2, energy_mean,
+               energy_m2):
+        """Merge the accumulators of a batch in the given rows."""
+        n_a = self.count[rows][:, None]
+        n_b = count[:, None]
+        n = n_a + n_b
+        for name, mean_b, m2_b in (('level', level_mean, level_m2),
+                                   ('energy', energy_mean, energy_m2)):
+            mean = getattr(self, name + '_mean')
+            m2 = getattr(self, name + '_m2')
+            delta = mean_b - mean[rows]
+            mean[rows] += delta * n_b / n
+            m2[rows] += m2_b + delta**2 * n_a * n_b / n
+        self.count[rows] += count
+
+    def add(self, categories, levels):
+        """Add a batch of measurements.
+        - categories -- category of each measurement, shape (n,)
+        - levels -- band levels (dB) of each measurement, shape (n, bands)
+        """
+        levels = np.asarray(levels, dtype=float)
+        if levels.ndim != 2 or levels.shape[1] != len(self.bands):
+            raise ValueError(f"levels must have shape (n, {len(self.bands)})"
+                             f", not {levels.shape}")
+        rows, groups = self._category_rows(categories)
+        # broadband level in column 0, then the bands
+        values = np.column_stack([band_math.band_sum(levels + self.weights),
+                                  levels])
+        # accumulators of the batch, one row for each category in it:
+        # measurements sorted by category, then reduced one contiguous
+        # slice for each category (every category has count > 0)
+        count = np.bincount(groups, minlength=len(rows))
+        starts = np.concatenate([[0], np.cumsum(count)[:-1]])
+        values = values[np.argsort(groups, kind='stable')]
+        batch = [count]
+        for x in (values, 10**(values/10)):
+            batch += _slice_stats(x, starts, count)
+        self._merge(rows, *batch)
+
+    def merge(self, other):
+        """Merge the measurements of another SpectrumAggregator with the
+        same bands and weighting (e.g. one filled in another process).
+        """
+        if (not np.array_equal(self.bands, other.bands)
+                or self.weighting != other.weighting):
+            raise ValueError("cannot merge aggregators with different bands "
+                             "or weighting")
+        rows, groups = self._category_rows(other.categories)
+        self._merge(rows[groups], *(getattr(other, name)
+                                    for name in self._ACCUMULATORS))
+
+    def energetic_mean(self):
+        """Energetic mean (dB), shape (categories, 1 + bands)."""
+        return 10*np.log10(self.energy_mean)
+
+    def arithmetic_mean(self):
+        """Arithmetic mean of the levels (dB), shape
+        (categories, 1 + bands).
+        """
+        return self.level_mean.copy()
+
+    def std(self, ddof=1):
+        """Standard deviation of the levels (dB), shape
+        (categories, 1 + bands), nan where count <= ddof.
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.sqrt(self.level_m2 / (self.count[:, None] - ddof))
+
+    def energy_std(self, ddof=1):
+        """Standard deviation of the energies 10**(L/10), shape
+        (categories, 1 + bands), nan where count <= ddof.
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.sqrt(self.energy_m2 / (self.count[:, None] - ddof))
+
+    def database(self, mean='energetic', ddof=1):
+        """Return the category spectra as a my_module.SpectrumDatabase,
+        with the broadband level as first band.
+        - mean -- 'energetic' or 'arithmetic' mean in the 'media' column
+        - ddof -- delta degrees of freedom of the dev.std (default 1)
+        """
+        if mean == 'energetic':
+            means = self.energetic_mean()
+        elif mean == 'arithmetic':
+            means = self.arithmetic_mean()
+        else:
+            raise ValueError(f"unknown mean {mean!r}, "
+                             "use 'energetic' or 'arithmetic'")
+        return my_module.SpectrumDatabase(
+            bands=np.concatenate([[self.broadband_label], self.bands]),
+            categories=self.categories,
+            mean=means,
+            std=self.std(ddof))
+
+    def to_csv(self, outputfile, mean='energetic', ddof=1):
+        """Write the category spectra in outputfile with the layout of
+        power_spectra.csv (see database and SpectrumDatabase.to_csv).
+        """
+        self.database(mean, ddof).to_csv(outputfile)
+
+    def save(self, outputfile):
+        """Save the state of the aggregator in outputfile (.npz)."""
+        np.savez(outputfile,
+                 bands=self.bands,
+                 categories=np.array(self.categories, dtype=str),
+                 broadband_label=self.broadband_label,
+                 weighting=self.weighting,
+                 **{name: getattr(self, name)
+                    for name in self._ACCUMULATORS})
+
+    @classmethod
+    def load(cls, inputfile):
+        """Return the SpectrumAggregator saved in inputfile by save."""
+        with np.load(inputfile, allow_pickle=False) as data:
+            aggregator = cls(data['bands'], str(data['broadband_label']),
+                             str(data['weighting']))
+            aggregator.categories = list(data['categories'])
+            aggregator._rows = {name: row for row, name
+                                in enumerate(aggregator.categories)}
+            for name in cls._ACCUMULATORS:
+                setattr(aggregator, name, data[name])
+        return aggregator
+
+
+def aggregate(categories, levels, bands, broadband_label='$L_{Aeq}$',
+              weighting='A', mean='energetic'):
+    """Return the SpectrumDatabase of the category spectra of the
+    measurements (see SpectrumAggregator).
+    - categories -- category of each measurement, shape (n,)
+    - levels -- band levels (dB) of each measurement, shape (n, bands)
+    - bands -- labels of the bands
+    """
+    aggregator = SpectrumAggregator(bands, broadband_label, weighting)
+    aggregator.add(categories, levels)
+    return aggregator.database(mean)
@@ -1,7 +1,8 @@
 import tkinter as tk
 import random
-import time
 import math
+import logging
+from frame_scheduler import FrameScheduler
 
 window = tk.Tk()
 window.title("Second animation")
@@ -40,32 +41,18 @@ center = canvas.create_oval(x_c-r_c, y_c-r_c, x_c+r_c, y_c+r_c, fill="black")
 circle = canvas.create_oval(x_c-radius, y_c-radius, x_c+radius, y_c+radius)
 disc = canvas.create_oval(x-r_disc, y-r_disc, x+r_disc, y+r_disc, fill="red")
 
-canvas.update()
-canvas.after(dt)
-
-t0 = time.time()
-delay_sum = 0
-for i in range(n_frames):
-    t1 = time.time()
-
+def draw(i):
+    """Move the disc to its position at the frame i."""
+    global x, y
     dx = (radius*math.cos(theta0 + (i+1)*dt/1000*omega) + x_c) - x
     dy = (radius*math.sin(theta0 + (i+1)*dt/1000*omega) + y_c) - y
     x+=dx
     y+=dy
     canvas.move(disc, dx, dy)
-    canvas.update()
-
-    t2 = time.time()
-    delay = t2-t1
-    delay_sum += delay
-
-    canvas.after(dt)
-
-
-tend = time.time()
-print(f"mean delay per frame: {delay_sum*1000/n_frames:2.2f} ms @ {fps} fps")
-print(f"total delay: {delay_sum*1000:2.2f} ms @ {fps} fps")
-print(f"given running time: {running_time:.2f} s")
-print(f"actual running time: {tend-t0:.2f} s")
 
-# window.mainloop()
+# timing statistics of the run as a JSON record (frame_scheduler logger)
+logging.basicConfig(level=logging.INFO, format="%(name)s %(message)s")
+scheduler = FrameScheduler(canvas, fps, draw, n_frames=n_frames,
+                           on_done=window.destroy, name="circular_uniform")
+scheduler.start()
+window.mainloop()
@@ -13,6 +13,14 @@ import tkinter as tk
 from scipy.integrate import odeint
 from scipy import signal
 import time
+import cyclotron_boris
+import cyclotron_engine
+import cyclotron_fields
+import cyclotron_playback
+import cyclotron_recorder
+import cyclotron_worker
+import frame_budget
+import track_layer
 
 class Cyclotron:
     def __init__(self):
@@ -20,6 +28,43 @@ class Cyclotron:
         the length scale, the variables to monitor.
         """
         self.delayed = 0 # counter for delayed frames
+        self.meter = frame_budget.FrameMeter() # achieved fps, delayed rate
+        # adapt the substeps and the tolerance of each solve to fit a
+        # fraction solve_budget of the frame interval (see solve_adaptive)
+        self.adaptive = False
+        self.solve_budget = 0.5
+        self.step_budget = None # frame_budget.StepBudget
+        # solve with the fast right-hand side of cyclotron_fields (same
+        # trajectories of self.derive), False to use self.derive
+        self.fast_rhs = True
+        # relativistic equations of motion (momentum state, see
+        # cyclotron_fields.derive_relativistic), False for the classical ones
+        self.relativistic = False
+        # integrate with the fixed step, energy conserving Boris pusher of
+        # cyclotron_boris instead of odeint (long runs)
+        self.boris = False
+        # integrate in a worker thread ahead of the frames (see
+        # move_threaded), False to solve on the Tk thread in move
+        self.threaded = True
+        self.buffer_size = 64 # states integrated ahead by the worker
+        self.producer = None # cyclotron_worker.Producer while playing
+        # play back a trajectory precomputed in the background by
+        # cyclotron_engine (see move_playback and seek), False to integrate
+        # while playing
+        self.playback_mode = False
+        self.playback = None # cyclotron_playback.Playback of the data
+        self.shown_playback = None # Playback drawn on canvas
+        self.on_frame = None # called with the time of each playback frame
+        # track on canvas: maximum number of points (None for no limit)
+        # and minimum distance between two points (pixel), see track_layer
+        self.track_length = 20000
+        self.track_step = 1.0
+        # record the states of each run from the first frame in a binary
+        # file (see cyclotron_recorder), e.g. "run_{}.cyc" formatted with
+        # the run number (not in playback mode); None not to record
+        self.record_path = None
+        self.recorder = None # cyclotron_recorder.Recorder of the run
+        self.n_runs = 0 # runs recorded
 
         # default data
         self.default_timescale = 6.5e-5
@@ -54,6 +99,8 @@ class Cyclotron:
                                "p = ... eV/c",
                                "K = ... eV",
                                "\u03B3 = ...",
+                               "fps = ...",
+                               "delayed = ... %",
                               )
 
         # set initial values for input_data and timescale
@@ -71,16 +118,28 @@ class Cyclotron:
         If static_flag=False set only non static parameters.
         """
         if static_flag:
+            self.stop_producer()
+            self.close_recorder()
             self.x, self.y, self.vx, self.vy = self.input_data[:4]
             self.q, self.m, self.B, self.E, self.gap, self.d_r = self.input_data[4:-2]
             self.lengthscale, self.fps = self.input_data[-2:]
             # animation features
             self.ms = 1000/self.fps # time interval between frames (ms)
             self.dt = 1e-3 * self.ms * self.timescale # time step (s)
+            self.step_budget = frame_budget.StepBudget(
+                1e-3 * self.ms * self.solve_budget)
+            self.meter.reset()
             # time array to solve differential equations
             self.t = np.array([0, self.dt])
+            self.shown_playback = None
+            self.last_frame = None # time of the last frame (s)
         else:
             self.q, self.m, self.B, self.E = self.input_data[4:-4]
+            if self.producer is not None: # integrate again with new data
+                self.producer.reset(self.t[0],
+                                    (self.x, self.y, self.vx, self.vy))
+        if self.playback_mode:
+            self.prepare_playback()
 
     def set_colors(self):
         """Set the particle color checking the charge and the dees colors
@@ -116,11 +175,22 @@ class Cyclotron:
         K_eV = p_eV**2 / (2 * self.m * c**2 / qp)
         omega = self.q*self.B/self.m # cyclotron frequency
         gamma = 1 / (np.sqrt(1 - (self.v/c)**2))
+        if self.relativistic:
+            p_eV = gamma * p_eV
+            K_eV = p_eV**2 / ((gamma + 1) * self.m * c**2 / qp)
+            omega = omega / gamma
         monitors[0]["text"] = f"T = {np.abs((2*np.pi)/omega):.3e} s"
         monitors[1]["text"] = f"v = {self.v:.3e} m/s"
         monitors[2]["text"] = f"p = {p_eV:.3e} eV/c"
         monitors[3]["text"] = f"K = {K_eV:.3e} eV"
         monitors[4]["text"] = f"\u03B3 = {gamma:.3e}"
+        fps, delayed_rate = self.meter.fps, self.meter.delayed_rate
+        if fps is None:
+            monitors[5]["text"] = "fps = ..."
+            monitors[6]["text"] = "delayed = ... %"
+        else:
+            monitors[5]["text"] = f"fps = {fps:.1f}"
+            monitors[6]["text"] = f"delayed = {100*delayed_rate:.1f} %"
 
     def draw_first_frame(self, canvas):
         """Draw the first frame of the animation on the given canvas."""
@@ -174,12 +244,22 @@ class Cyclotron:
         self.particle = self.canvas.create_oval(coord,
                                                 fill=self.p_color,
                                                 outline=self.p_color)
+        # track of the particle, a few polylines updated at each frame
+        self.track = track_layer.TrackLayer(self.canvas,
+                                            max_points=self.track_length,
+                                            min_step=self.track_step)
+        self.track.add(cx + x, ch - (cy + y), self.p_color)
 
     def derive(self, t, z, params):
         """Compute the derivative of input z (tuple containing x, y, vx, vy)
         at time t.
         params contains: charge, mass, B field, E field, gap size, dee radius.
+        z can also be an array of states (N, 4) with t of shape (N,): then
+        all the derivatives (N, 4) are computed at once (see
+        cyclotron_fields.derive_array).
         """
+        if np.ndim(z) > 1:
+            return cyclotron_fields.derive_array(t, z, params)
         x, y, vx, vy = z
         q, m, B, E, gap, d_r = params
         omega = q*B/m # cyclotron frequency
@@ -203,17 +283,182 @@ class Cyclotron:
         derivs = [vx, vy, ax, ay]
         return derivs
 
-    def compute_coord(self, z0, t, params):
+    def solve(self, z0, t, params, rtol=None):
         """Solve the differential equations using odeint at times in t array.
         z0 is a tuple containing x0, y0, vx0, vy0.
         params contains: charge, mass, B field, E field, gap size, dee radius.
-        Then updates self.x, self.y, self.vx, self.vy.
+        If t has more than two times, evenly spaced, they are substeps: the
+        solver step is limited to their spacing (one Boris step each).
+        rtol is the odeint relative tolerance (default None, odeint's).
+        Return x, y, vx, vy at t[-1], without changing the instance (it
+        runs in the worker thread of move_threaded).
+        """
+        hmax = (t[-1] - t[0]) / (len(t) - 1) if len(t) > 2 else 0.0
+        if self.boris and len(t) > 2:
+            n_steps = len(t) - 1
+            _, sol, _ = cyclotron_boris.push(z0, params, hmax, n_steps,
+                                             t0=t[0],
+                                             relativistic=self.relativistic)
+        elif self.boris:
+            # Boris steps of at most cyclotron_boris.default_step in t
+            n_steps = int(np.ceil((t[-1] - t[0])
+                                  / cyclotron_boris.default_step(params)))
+            _, sol, _ = cyclotron_boris.push(z0, params,
+                                             (t[-1] - t[0])/n_steps, n_steps,
+                                             t0=t[0],
+                                             relativistic=self.relativistic)
+        elif self.relativistic:
+            derive = cyclotron_fields.make_derive_relativistic(params)
+            sol = odeint(derive, cyclotron_fields.to_momentum(z0), t,
+                         tfirst=True, rtol=rtol, hmax=hmax)
+            sol = cyclotron_fields.to_velocity(sol)
+        elif self.fast_rhs:
+            derive = cyclotron_fields.make_derive(params)
+            sol = odeint(derive, z0, t, tfirst=True, rtol=rtol, hmax=hmax)
+        else:
+            sol = odeint(self.derive, z0, t, args=(params,), tfirst=True,
+                         rtol=rtol, hmax=hmax)
+        return sol[:, 0][-1], sol[:, 1][-1], sol[:, 2][-1], sol[:, 3][-1]
+
+    def max_step(self, params):
+        """Return the longest substep of solve_adaptive for params: half
+        the time to cross the gap, or the Boris step.
+        """
+        if self.boris:
+            return cyclotron_boris.default_step(params)
+        return cyclotron_engine.default_max_step(params)
+
+    def solve_adaptive(self, z0, t, params):
+        """Solve as solve from t[0] to t[-1], in the substeps and with the
+        tolerance chosen by self.step_budget: substeps no longer than
+        self.max_step(params), with a looser tolerance if the solve is too
+        slow (move shortens t with step_budget.frame_step to fit the
+        frame time budget). Return x, y, vx, vy at t[-1].
         """
-        sol = odeint(self.derive, z0, t, args=(params,), tfirst=True)
-        self.x = sol[:, 0][-1]
-        self.y = sol[:, 1][-1]
-        self.vx = sol[:, 2][-1]
-        self.vy = sol[:, 3][-1]
+        n = self.step_budget.substeps(t[-1] - t[0], self.max_step(params))
+        t1 = time.perf_counter()
+        state = self.solve(z0, np.linspace(t[0], t[-1], n + 1), params,
+                           rtol=self.step_budget.rtol)
+        self.step_budget.update(time.perf_counter() - t1, n)
+        return state
+
+    def compute_coord(self, z0, t, params):
+        """Solve the differential equations at times in t array (see
+        solve), then update self.x, self.y, self.vx, self.vy.
+        """
+        if self.adaptive:
+            self.x, self.y, self.vx, self.vy = self.solve_adaptive(z0, t,
+                                                                   params)
+        else:
+            self.x, self.y, self.vx, self.vy = self.solve(z0, t, params)
+
+    def record(self, states):
+        """Record the states (n, 5) of t, x, y, vx, vy if self.record_path
+        is set, opening the file of the run (with the initial state and
+        the timescale at that moment) at the first call.
+        """
+        if self.record_path is None:
+            return
+        if self.recorder is None:
+            self.n_runs += 1
+            self.recorder = cyclotron_recorder.Recorder(
+                self.record_path.format(self.n_runs), self.input_data,
+                self.timescale)
+            self.recorder.append(0.0, *self.input_data[:4])
+        self.recorder.extend(states)
+
+    def close_recorder(self):
+        """Close the recording of the run, if any."""
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+
+    def start_producer(self):
+        """Start the worker thread integrating ahead from the current
+        state, with the current time step and parameters at each step.
+        """
+        solve = self.solve_adaptive if self.adaptive else self.solve
+        self.producer = cyclotron_worker.Producer(
+            solve, self.t[0], (self.x, self.y, self.vx, self.vy),
+            lambda: 1e-3 * self.ms * self.timescale,
+            lambda: (self.q, self.m, self.B, self.E, self.gap, self.d_r),
+            capacity=self.buffer_size)
+        self.producer.start()
+
+    def stop_producer(self):
+        """Stop the worker thread, if running."""
+        if self.producer is not None:
+            self.producer.stop()
+            self.producer = None
+
+    def prepare_playback(self):
+        """Start computing the trajectory to play back for the current
+        data in the background, unless it is already computed for them
+        (e.g. after Stop with the same data).
+        """
+        options = {'method': 'boris' if self.boris else 'RK45',
+                   'relativistic': self.relativistic}
+        if (self.playback is None
+            or not self.playback.matches(self.input_data, **options)):
+            self.playback = cyclotron_playback.Playback(self.input_data,
+                                                        **options)
+
+    def playback_step(self, duration):
+        """Return the time step (s) to sample the playback track over
+        duration: 1/64 of the cyclotron period, coarser if it would give
+        more than self.track_length points.
+        """
+        step = self.playback.period / 64
+        if self.track_length:
+            step = max(step, duration / self.track_length)
+        return step
+
+    def show_states(self, t, states, monitors):
+        """Extend the track through the states (n, 4) at the times t and
+        show the particle at the last one, updating the monitors.
+        """
+        scale = self.lengthscale
+        cx = self.cx
+        cy = self.cy
+        ch = self.ch
+        p_r = self.p_r
+        x = states[:, 0] * scale
+        y = states[:, 1] * scale
+        self.track.extend(cx + x, ch - (cy + y), self.p_color)
+        self.t[0] = t[-1]
+        self.x, self.y, self.vx, self.vy = states[-1]
+        self.dt = 1e-3 * self.ms * self.timescale # time step (s)
+        self.t[1] = self.t[0] + self.dt
+        self.set_colors()
+        self.monitors_update(monitors)
+        coord = (cx + (x[-1] - p_r),
+                 ch - (cy + (y[-1] - p_r)),
+                 cx + (x[-1] + p_r),
+                 ch - (cy + (y[-1] + p_r)))
+        self.canvas.coords(self.particle, coord)
+        self.canvas.itemconfigure(self.particle,
+                                  fill=self.p_color,
+                                  outline=self.p_color)
+        self.canvas.itemconfigure(self.d1, outline=self.d1_color)
+        self.canvas.itemconfigure(self.d2, outline=self.d2_color)
+
+    def seek(self, t, monitors):
+        """Jump to time t of the playback trajectory (clipped to its
+        duration): redraw the track from the start and show the particle
+        at t, sampling the dense solution (no integration).
+        Return False if the trajectory is not computed yet.
+        """
+        if self.playback is None or not self.playback.ready:
+            return False
+        t = min(max(t, 0.0), self.playback.duration)
+        times, states = self.playback.states(0.0, t,
+                                             self.playback_step(t))
+        x0, y0 = self.input_data[:2] * self.lengthscale
+        self.track.clear()
+        self.track.add(self.cx + x0, self.ch - (self.cy + y0), self.p_color)
+        self.show_states(times, states, monitors)
+        self.shown_playback = self.playback
+        return True
 
     def move(self, PlayPause_func, btn_play, status_bar, monitors):
         """Perform the animation. Use PlayPause_func to pause the 
@@ -224,6 +469,12 @@ class Cyclotron:
         the animation fps constant, limitations depends on hardware.
         """
         global run
+        if self.playback_mode:
+            self.move_playback(PlayPause_func, btn_play, status_bar, monitors)
+            return
+        if self.threaded:
+            self.move_threaded(PlayPause_func, btn_play, status_bar, monitors)
+            return
         t1 = time.time()
         move_params = (PlayPause_func, btn_play, status_bar, monitors)
         self.set_colors()
@@ -238,16 +489,15 @@ class Cyclotron:
             ch = self.ch
             p_r = self.p_r
 
-            # canvas old coordinates of particle
-            old_x = self.x * scale
-            old_y = self.y * scale
-
             # update the dt and check t array
             self.dt = 1e-3 * self.ms * self.timescale # time step (s)
             if (self.t[1] - self.t[0]) == self.dt:
                 pass
             else:
                 self.t[1] = self.t[0] + self.dt
+            if self.adaptive: # the part of dt that fits the budget
+                self.t[1] = self.t[0] + self.step_budget.frame_step(
+                    self.dt, self.max_step(params))
 
             self.compute_coord(z0, self.t, params)
             
@@ -279,12 +529,8 @@ class Cyclotron:
                                           outline=self.p_color)
                 self.canvas.itemconfigure(self.d1, outline=self.d1_color)
                 self.canvas.itemconfigure(self.d2, outline=self.d2_color)
-                # canvas coordinates of track segment
-                x1 = cx + old_x
-                x2 = cx + x
-                y1 = ch - (cy + old_y)
-                y2 = ch - (cy + y)
-                self.canvas.create_line(x1, y1, x2, y2, fill=self.p_color)
+                # extend the track to the new position
+                self.track.add(cx + x, ch - (cy + y), self.p_color)
 
                 # update the dt, check and increment t array
                 self.dt = 1e-3 * self.ms * self.timescale # time step (s)
@@ -293,9 +539,11 @@ class Cyclotron:
                 else:
                     self.t[0] = self.t[1]
                     self.t[1] = self.t[0] + self.dt
+                self.record([(self.t[0], self.x, self.y, self.vx, self.vy)])
 
                 t2 = time.time()
                 delay = (t2 - t1)*1000
+                self.meter.tick(self.ms < delay)
                 if self.ms >= delay:
                     d_ms = int(self.ms - delay)
                     self.canvas.after(d_ms, self.move, *move_params)
@@ -305,7 +553,140 @@ class Cyclotron:
                 # self.canvas.after(int(self.ms - delay), self.move_particle)
         else:
             # print("Delayed frames:", self.delayed)
-            pass
+            self.meter.reset()
+
+    def move_threaded(self, PlayPause_func, btn_play, status_bar, monitors):
+        """Perform the animation as move, with the differential equations
+        solved ahead by a worker thread (start_producer) into a ring
+        buffer. At each frame the Tk loop takes the states up to the time
+        to show (timescale times the elapsed time), draws the track
+        through them and moves the particle to the newest one. If the
+        worker is late the frame is skipped (counted in self.delayed) and
+        the animation waits for it, so a slow solve does not block the
+        window.
+        """
+        global run
+        t1 = time.time()
+        move_params = (PlayPause_func, btn_play, status_bar, monitors)
+        if not run: # paused: integrate again from the shown state on play
+            self.stop_producer()
+            self.meter.reset()
+            return
+        if self.producer is None:
+            self.start_producer()
+            self.sim_time = self.t[0] # time to show (s)
+        else:
+            self.sim_time += (t1 - self.last_frame) * self.timescale
+        self.last_frame = t1
+        if self.producer.error is not None:
+            raise self.producer.error
+
+        states = self.producer.ring.pop_until(self.sim_time)
+        if len(self.producer.ring) == 0: # worker late, wait for it
+            self.sim_time = min(self.sim_time, self.t[0])
+        self.meter.tick(len(states) == 0)
+        if len(states) == 0:
+            self.delayed += 1
+        else:
+            scale = self.lengthscale
+            cx = self.cx
+            cy = self.cy
+            cw = self.cw
+            ch = self.ch
+            p_r = self.p_r
+            # canvas coordinates of the new states
+            x = states[:, 1] * scale
+            y = states[:, 2] * scale
+            if ( # particle would go out of canvas
+                 np.any(cx + x < 0) or np.any(cx + x > cw)
+                 or np.any(cy + y < 0) or np.any(cy + y > ch)
+                ):
+                self.stop_producer()
+                btn_play["state"] = "disabled"
+                msg = "Animation ended, next position would be out of canvas."
+                status_bar["text"] = msg
+                return
+            # extend the track through the new positions
+            self.track.extend(cx + x, ch - (cy + y), self.p_color)
+            self.record(states)
+            self.t[0], self.x, self.y, self.vx, self.vy = states[-1]
+            self.dt = 1e-3 * self.ms * self.timescale # time step (s)
+            self.t[1] = self.t[0] + self.dt
+            self.set_colors()
+            self.monitors_update(monitors)
+            coord = (cx + (x[-1] - p_r),
+                     ch - (cy + (y[-1] - p_r)),
+                     cx + (x[-1] + p_r),
+                     ch - (cy + (y[-1] + p_r)))
+            self.canvas.coords(self.particle, coord)
+            self.canvas.itemconfigure(self.particle,
+                                      fill=self.p_color,
+                                      outline=self.p_color)
+            self.canvas.itemconfigure(self.d1, outline=self.d1_color)
+            self.canvas.itemconfigure(self.d2, outline=self.d2_color)
+
+        delay = (time.time() - t1)*1000
+        self.canvas.after(max(int(self.ms - delay), 0), self.move_threaded,
+                          *move_params)
+
+    def move_playback(self, PlayPause_func, btn_play, status_bar, monitors):
+        """Perform the animation as move, playing back the trajectory
+        precomputed by prepare_playback: at each frame the time to show
+        advances by timescale times the elapsed time, the track is
+        extended through the dense solution sampled up to it and the
+        particle moved there, at any timescale. While the trajectory is
+        being computed the animation waits for it; at its end (extraction
+        or time limit) the animation is paused with PlayPause_func.
+        """
+        global run
+        t1 = time.time()
+        move_params = (PlayPause_func, btn_play, status_bar, monitors)
+        if not run: # paused: restart the clock on play
+            self.last_frame = None
+            self.meter.reset()
+            return
+        if self.playback is None:
+            self.prepare_playback()
+        if not self.playback.ready: # computing, wait for it
+            status_bar["text"] = "Computing the trajectory..."
+            self.last_frame = None
+            self.canvas.after(int(self.ms), self.move_playback, *move_params)
+            return
+        if self.playback is not self.shown_playback: # new trajectory
+            status_bar["text"] = "Playing..."
+            self.seek(self.t[0], monitors)
+            self.last_frame = None
+        if self.last_frame is None:
+            self.last_frame = t1
+        duration = self.playback.duration
+        sim_time = min(self.t[0] + (t1 - self.last_frame)*self.timescale,
+                       duration)
+        self.last_frame = t1
+        if sim_time > self.t[0]:
+            times, states = self.playback.states(
+                self.t[0], sim_time, self.playback_step(sim_time - self.t[0]))
+            x = states[:, 0] * self.lengthscale
+            y = states[:, 1] * self.lengthscale
+            if ( # particle would go out of canvas
+                 np.any(self.cx + x < 0) or np.any(self.cx + x > self.cw)
+                 or np.any(self.cy + y < 0) or np.any(self.cy + y > self.ch)
+                ):
+                btn_play["state"] = "disabled"
+                msg = "Animation ended, next position would be out of canvas."
+                status_bar["text"] = msg
+                return
+            self.show_states(times, states, monitors)
+        if self.on_frame is not None:
+            self.on_frame(self.t[0])
+        self.meter.tick((time.time() - t1)*1000 > self.ms)
+        if self.t[0] >= duration:
+            PlayPause_func()
+            status_bar["text"] = "Playback ended, stop or seek to play again."
+            return
+
+        delay = (time.time() - t1)*1000
+        self.canvas.after(max(int(self.ms - delay), 0), self.move_playback,
+                          *move_params)
 
 def TscaleDown():
     """"Reduce the time scale."""
@@ -354,6 +735,32 @@ def PlayPause():
         status_bar["text"] = "Paused"
         btn_play.configure(text="\u25B6")
 
+def TogglePlayback():
+    """Switch between the playback of a precomputed trajectory and the
+    integration while playing, then stop the animation.
+    """
+    global playback_var, Animation
+    Animation.playback_mode = bool(playback_var.get())
+    Stop()
+
+def Seek(value):
+    """Jump to the time of the playback given by the time slider value
+    (per mille of the trajectory duration).
+    """
+    global Animation
+    playback = Animation.playback
+    if (not Animation.playback_mode or playback is None
+        or not playback.ready):
+        return
+    t = float(value) / 1000 * playback.duration
+    if abs(t - Animation.t[0]) > playback.duration / 2000: # moved by the user
+        Animation.seek(t, monitors)
+
+def SliderUpdate(t):
+    """Move the time slider to the playback time t."""
+    global scl_time, Animation
+    scl_time.set(1000 * t / Animation.playback.duration)
+
 def Stop():
     """Stop the animation, redraw the first frame."""
     global stopped, btn_play, entries, Animation
@@ -372,6 +779,7 @@ def Stop():
         Animation.set_data(static_flag=True)
         Animation.monitors_update(monitors)
         FirstFrame()
+        scl_time.set(0)
         status_bar["text"] = "Ready"
 
 def Read():
@@ -413,6 +821,7 @@ def SetWindow(AnimationClass):
     global canvas
     global btn_play
     global entries, lbl_tscale, monitors, status_bar
+    global playback_var, scl_time
     global run, stopped
 
     run = False
@@ -475,6 +884,20 @@ def SetWindow(AnimationClass):
     btn_tscale_down.grid(row=0, column=0, sticky="nsew")
     btn_tscale_up.grid(row=0, column=2, sticky="nsew")
     frm_tscale.pack()
+
+    # playback switch and time slider inside their frame (inside side frame)
+    frm_playback = tk.Frame(master=frm_side, relief=tk.RIDGE, borderwidth=0)
+    playback_var = tk.IntVar(value=int(Animation.playback_mode))
+    chk_playback = tk.Checkbutton(master=frm_playback, text="playback",
+                                  variable=playback_var,
+                                  command=TogglePlayback)
+    scl_time = tk.Scale(master=frm_playback, from_=0, to=1000,
+                        resolution=0.1, orient=tk.HORIZONTAL, length=200,
+                        showvalue=False, label="time (\u2030)", command=Seek)
+    chk_playback.grid(row=0, column=0, sticky="W")
+    scl_time.grid(row=1, column=0)
+    frm_playback.pack(pady=10)
+    Animation.on_frame = SliderUpdate
     
     # monitor labels inside their frame (inside side frame)
     monitors = []
@@ -496,6 +919,7 @@ def SetWindow(AnimationClass):
     Reset()
 
     root.mainloop()
+    Animation.close_recorder()
 
 if __name__ == '__main__':
    SetWindow(Cyclotron)
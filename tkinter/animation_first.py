@@ -1,6 +1,7 @@
 import tkinter as tk
 import random
-import time
+import logging
+from frame_scheduler import FrameScheduler
 window = tk.Tk()
 window.title("First animation attempt")
 
@@ -30,33 +31,28 @@ dy = v_y/fps
 # fps_counter.grid(row=0, column=1, sticky="nw")
 
 disc = canvas.create_oval(x_c-radius, y_c-radius, x_c+radius, y_c+radius, fill="red")
-canvas.update()
-canvas.after(delay)
-t0 = time.time()
-dt_sum = 0
-for i in range(n_frames):
-    t1 = time.time()
-    x_min, y_min, x_max, y_max = canvas.coords(disc)
-    if (x_min<0) or (x_max>=WIDTH):
-        dx = -dx
-    if (y_min<0) or (y_max>=HEIGHT):
-        dy = -dy
-    # canvas.move(disc, random.randint(-10, 10), random.randint(-10, 10))
-    canvas.move(disc, dx, dy)
-    canvas.update()
-    t2 = time.time()
-    dt = t2-t1
-    dt_sum += dt
-    # fps_counter["text"]=f"dt_sum = {dt_sum*1000:2.2f} ms"
-    # if dt*1000 < delay:
-    #     canvas.after(round(delay-dt*1000))
-    canvas.after(delay)
+last_frame = -1
 
-tend = time.time()
-print(f"mean dt per frame: {dt_sum*1000/n_frames:2.2f} ms @ {fps} fps")
-print(f"total dt: {dt_sum*1000:2.2f} ms @ {fps} fps")
-print(f"given running time: {running_time:.2f} s")
-print(f"actual running time: {tend-t0:.2f} s")
+def draw(i):
+    """Move the disc to the frame i, one step for each frame since the
+    last drawn one (dropped frames included), bouncing on the borders.
+    """
+    global dx, dy, last_frame
+    for _ in range(i - last_frame):
+        x_min, y_min, x_max, y_max = canvas.coords(disc)
+        if (x_min<0) or (x_max>=WIDTH):
+            dx = -dx
+        if (y_min<0) or (y_max>=HEIGHT):
+            dy = -dy
+        # canvas.move(disc, random.randint(-10, 10), random.randint(-10, 10))
+        canvas.move(disc, dx, dy)
+    last_frame = i
+
+# timing statistics of the run as a JSON record (frame_scheduler logger)
+logging.basicConfig(level=logging.INFO, format="%(name)s %(message)s")
+scheduler = FrameScheduler(canvas, fps, draw, n_frames=n_frames,
+                           name="first")
+scheduler.start()
 
 # for i in range(n_frames):
 #     canvas.after(delay)
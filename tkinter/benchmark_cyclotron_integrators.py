@@ -0,0 +1,99 @@
+"""Benchmark of the integrators of the cyclotron for long runs.
+A proton turns inside one dee (magnetic field only, so the kinetic energy
+must stay constant) for many turns; for odeint, solve_ivp and the Boris
+pusher (cyclotron_boris) at several tolerances / steps print the CPU time,
+the relative drift of the kinetic energy and the distance from the exact
+circular motion (cyclotron_analytic.arc) at the end, i.e. the accuracy
+per CPU second. Then print the cost of a Boris step, for one particle and
+for many particles at once.
+
+Command line usage:
+    python benchmark_cyclotron_integrators.py [turns]
+"""
+
+import sys
+import time
+import numpy as np
+from scipy.integrate import odeint, solve_ivp
+import cyclotron_analytic
+import cyclotron_boris
+import cyclotron_engine
+import cyclotron_fields
+
+n_turns = 1000
+n_particles = 10000
+
+def cpu_time(func):
+    """Return the CPU time (s) of func() and its result."""
+    t1 = time.process_time()
+    result = func()
+    t2 = time.process_time()
+    return t2 - t1, result
+
+def errors(z, z_exact):
+    """Return the relative kinetic energy drift and the position error (m)
+    of the final state z against z_exact.
+    """
+    K = z[2]**2 + z[3]**2
+    K_exact = z_exact[2]**2 + z_exact[3]**2
+    return abs(K/K_exact - 1), np.hypot(z[0] - z_exact[0], z[1] - z_exact[1])
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        n_turns = int(sys.argv[1])
+    _, params = cyclotron_engine.split_data(cyclotron_engine.DEFAULT_DATA)
+    q, m, B, E, gap, d_r = params
+    period = cyclotron_engine.cyclotron_period(q, m, B)
+    qmB = q/m*B
+    # circle of radius 0.1 m inside the right dee
+    r = 0.1
+    z0 = np.array([0.35, 0.0, 0.0, - qmB*r]) # centre (0.25, 0)
+    t_end = n_turns * period
+    z_exact = cyclotron_analytic.arc(z0, t_end, qmB)
+    derive = cyclotron_fields.make_derive(params)
+    atol = 1e-12 * np.array([d_r, d_r, abs(qmB*r), abs(qmB*r)])
+
+    runs = []
+    for rtol in (1e-6, 1e-9, 1e-12):
+        runs.append((f"odeint rtol={rtol:.0e}", lambda rtol=rtol: odeint(
+            derive, z0, [0, t_end], tfirst=True, rtol=rtol, atol=atol,
+            mxstep=10**9)[-1]))
+    for method, rtol in (('RK45', 1e-6), ('RK45', 1e-9), ('DOP853', 1e-9),
+                         ('DOP853', 1e-12)):
+        runs.append((f"solve_ivp {method} rtol={rtol:.0e}",
+                     lambda method=method, rtol=rtol: solve_ivp(
+                         derive, (0, t_end), z0, method=method, rtol=rtol,
+                         atol=atol).y[:, -1]))
+    for steps in (16, 64, 256):
+        dt = period/steps
+        runs.append((f"Boris {steps} steps/turn",
+                     lambda dt=dt, steps=steps: cyclotron_boris.push(
+                         z0, params, dt, steps*n_turns)[1][-1]))
+
+    print(f"{n_turns} turns inside a dee:")
+    print(f"{'integrator':<28}{'CPU (s)':>10}{'energy drift':>15}"
+          f"{'position error (m)':>21}")
+    for name, run in runs:
+        seconds, z = cpu_time(run)
+        drift, error = errors(z, z_exact)
+        print(f"{name:<28}{seconds:>10.3f}{drift:>15.2e}{error:>21.2e}")
+
+    # cost of a step
+    kernel = "numba" if cyclotron_boris.njit is not None else "Python"
+    n_steps = 100000
+    cyclotron_boris.push(z0, params, period/64, 10) # compile
+    seconds, _ = cpu_time(lambda: cyclotron_boris.push(
+        z0, params, period/64, n_steps))
+    print(f"Boris step, one particle ({kernel} loop): "
+          f"{seconds/n_steps*1e9:.0f} ns")
+    z = np.asfortranarray(np.tile(z0, (n_particles, 1)))
+    n_steps = 200
+
+    def run_array(z=z):
+        for k in range(n_steps):
+            z = cyclotron_boris.step_array(z, k*period/64, period/64, params)
+        return z
+
+    seconds, _ = cpu_time(run_array)
+    print(f"Boris step, {n_particles} particles (NumPy): "
+          f"{seconds/n_steps/n_particles*1e9:.0f} ns a particle")
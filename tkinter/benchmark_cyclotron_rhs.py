@@ -0,0 +1,122 @@
+"""Benchmark of the right-hand side of the cyclotron equations of motion.
+Compare Cyclotron.derive with the fast cyclotron_fields.make_derive, and
+with its numba compiled form (make_derive(params, compiled=True), skipped
+if numba is not installed), on the default proton parameters of the
+Cyclotron class, both in a single odeint call over many periods and frame
+by frame as in Cyclotron.move, and check that the trajectories are bit for
+bit the same. Then compare the branch-free cyclotron_fields.derive_array
+on many states at once with a loop of make_derive.
+"""
+
+import time
+import numpy as np
+from scipy.integrate import odeint
+from animation_class_cyclotron_2 import Cyclotron
+import cyclotron_fields
+
+n_periods = 50
+n_frames = 2000
+n_calls = 20000
+n_states = 100000
+
+def best_time(func, n_repeat=3):
+    """Return the best time (s) of n_repeat calls of func() and its
+    last result.
+    """
+    times = []
+    for _ in range(n_repeat):
+        t1 = time.perf_counter()
+        result = func()
+        t2 = time.perf_counter()
+        times.append(t2 - t1)
+    return min(times), result
+
+def frame_by_frame(derive, args, z0, dt, n_frames):
+    """Solve frame by frame as Cyclotron.move, two time points a call."""
+    z = np.array(z0, dtype=float)
+    t = np.array([0, dt])
+    for _ in range(n_frames):
+        z = odeint(derive, z, t, args=args, tfirst=True)[-1]
+        t += dt
+    return z
+
+if __name__ == '__main__':
+    cyclotron = Cyclotron()
+    cyclotron.set_data(static_flag=True)
+    z0 = (cyclotron.x, cyclotron.y, cyclotron.vx, cyclotron.vy)
+    params = (cyclotron.q, cyclotron.m, cyclotron.B, cyclotron.E,
+              cyclotron.gap, cyclotron.d_r)
+    derive = cyclotron_fields.make_derive(params)
+    jacobian = cyclotron_fields.make_jacobian(params)
+    if cyclotron_fields.njit is not None:
+        derive_compiled = cyclotron_fields.make_derive(params, compiled=True)
+        derive_compiled(0.0, np.array(z0, dtype=float)) # compile
+    else:
+        derive_compiled = None
+        print("numba is not installed, compiled=True skipped")
+
+    # single right-hand side calls
+    z = np.array([0.001, 0.01, 1e4, 1e4])
+    t_old, _ = best_time(lambda: [cyclotron.derive(1e-5, z, params)
+                                  for _ in range(n_calls)])
+    t_new, _ = best_time(lambda: [derive(1e-5, z) for _ in range(n_calls)])
+    print(f"right-hand side call: Cyclotron.derive {t_old/n_calls*1e6:.2f} us"
+          f", make_derive {t_new/n_calls*1e6:.2f} us "
+          f"({t_old/t_new:.1f}x)")
+    if derive_compiled is not None:
+        t_jit, _ = best_time(lambda: [derive_compiled(1e-5, z)
+                                      for _ in range(n_calls)])
+        print(f"right-hand side call: compiled {t_jit/n_calls*1e6:.2f} us "
+              f"({t_old/t_jit:.1f}x)")
+
+    # whole trajectory in one odeint call
+    period = 2*np.pi*cyclotron.m / (cyclotron.q*cyclotron.B)
+    t = np.linspace(0, n_periods*period, 200*n_periods)
+    t_old, sol_old = best_time(lambda: odeint(cyclotron.derive, z0, t,
+                                              args=(params,), tfirst=True))
+    t_new, sol_new = best_time(lambda: odeint(derive, z0, t, tfirst=True))
+    t_jac, sol_jac = best_time(lambda: odeint(derive, z0, t, Dfun=jacobian,
+                                              tfirst=True))
+    print(f"odeint over {n_periods} periods: Cyclotron.derive "
+          f"{t_old*1000:.1f} ms, make_derive {t_new*1000:.1f} ms "
+          f"({t_old/t_new:.1f}x), with Dfun {t_jac*1000:.1f} ms")
+    print("bit for bit same trajectory:", np.array_equal(sol_old, sol_new))
+    if derive_compiled is not None:
+        t_jit, sol_jit = best_time(lambda: odeint(derive_compiled, z0, t,
+                                                  tfirst=True))
+        print(f"odeint over {n_periods} periods: compiled "
+              f"{t_jit*1000:.1f} ms ({t_old/t_jit:.1f}x), bit for bit same "
+              f"trajectory: {np.array_equal(sol_old, sol_jit)}")
+    print("max difference with Dfun (m):",
+          np.max(np.abs(sol_jac[:, :2] - sol_old[:, :2])))
+
+    # frame by frame, as in Cyclotron.move
+    dt = cyclotron.dt
+    t_old, z_old = best_time(lambda: frame_by_frame(
+        cyclotron.derive, (params,), z0, dt, n_frames))
+    t_new, z_new = best_time(lambda: frame_by_frame(
+        cyclotron_fields.make_derive(params), (), z0, dt, n_frames))
+    print(f"{n_frames} frames: Cyclotron.derive {t_old*1000:.1f} ms, "
+          f"make_derive {t_new*1000:.1f} ms ({t_old/t_new:.1f}x)")
+    print("bit for bit same final state:", np.array_equal(z_old, z_new))
+    if derive_compiled is not None:
+        t_jit, z_jit = best_time(lambda: frame_by_frame(
+            cyclotron_fields.make_derive(params, compiled=True), (), z0, dt,
+            n_frames))
+        print(f"{n_frames} frames: compiled {t_jit*1000:.1f} ms "
+              f"({t_old/t_jit:.1f}x), bit for bit same final state: "
+              f"{np.array_equal(z_old, z_jit)}")
+
+    # many states at once, branch-free
+    rng = np.random.default_rng(0)
+    states = rng.uniform(-1, 1, (n_states, 4)) * [cyclotron.d_r,
+                                                   cyclotron.d_r, 4e4, 4e4]
+    times = rng.uniform(0, n_periods*period, n_states)
+    t_loop, d_loop = best_time(lambda: np.array(
+        [derive(ti, zi) for ti, zi in zip(times, states)]), n_repeat=1)
+    t_array, d_array = best_time(lambda: cyclotron_fields.derive_array(
+        times, states, params))
+    print(f"{n_states} states: make_derive loop "
+          f"{t_loop/n_states*1e9:.0f} ns, derive_array "
+          f"{t_array/n_states*1e9:.0f} ns a state ({t_loop/t_array:.0f}x), "
+          f"same values: {np.array_equal(d_loop, d_array)}")
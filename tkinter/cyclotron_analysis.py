@@ -0,0 +1,173 @@
+"""Analysis of recorded cyclotron trajectories, vectorized with NumPy.
+From the states (t, x, y, vx, vy) of a run (a cyclotron_recorder file, a
+cyclotron_engine.Trajectory, ...) find:
+- the gap crossings: the particle leaves one dee and enters the other one;
+  the crossing time is the one of x = 0 (linear interpolation), the
+  energy gain is the kinetic energy after minus before the gap
+- the turns: one every two crossings
+- the phase slip: RF phase (of the square wave of cyclotron_fields) at the
+  crossing minus the phase of the middle of the accelerating half period
+  (0 for a particle in phase, +-pi for one decelerated)
+- the extraction: first sample out of the dees and the gap, or on their
+  outer boundary (a run stopped at the extraction event of
+  cyclotron_engine ends there), after being inside, with the time, the
+  orbit radius and the kinetic energy there.
+Only whole-array operations are used, so 10**7 samples take about a second.
+
+Command line usage:
+    python cyclotron_analysis.py run.cyc [--relativistic]
+"""
+
+import argparse
+import numpy as np
+import cyclotron_engine
+import cyclotron_fields
+import cyclotron_recorder
+
+# relative tolerance on the squared dee radius of a sample on the boundary
+# (the extraction event of solve_ivp stops within about 1e-12 of it)
+BOUNDARY_RTOL = 1e-9
+
+class Analysis:
+    """Result of analyze.
+    Attributes (arrays have one value per gap crossing):
+    - t_crossing -- times of the crossings (x = 0) (s)
+    - direction -- +1 left to right, -1 right to left
+    - index_before, index_after -- last sample before, first after the gap
+    - gain -- kinetic energy gain of the crossings (eV)
+    - phase_slip -- RF phase of the crossings from the ideal one, in
+    (-pi, pi] (rad)
+    - t_turn -- start times of the turns (every second crossing) (s)
+    - n_turns -- number of complete turns
+    - extracted -- True if the particle leaves the dees
+    - t_extraction, r_extraction, K_extraction -- time (s), orbit radius
+    (m) and kinetic energy (eV) at the extraction (at the last sample if
+    not extracted)
+    """
+
+    def __init__(self, **results):
+        for name, value in results.items():
+            setattr(self, name, value)
+
+    def __len__(self):
+        """Number of gap crossings."""
+        return len(self.t_crossing)
+
+    def summary(self):
+        """Return a text summary of the analysis."""
+        if len(self):
+            gain = f"{np.mean(self.gain):.3e} eV mean gain per crossing"
+            slip = (f"phase slip {np.min(self.phase_slip):+.3f} .. "
+                    f"{np.max(self.phase_slip):+.3f} rad")
+        else:
+            gain, slip = "no gain", "no phase slip"
+        end = "extracted" if self.extracted else "not extracted, last sample"
+        return (f"{len(self)} gap crossings, {self.n_turns} turns, {gain}, "
+                f"{slip}\n{end}: t = {self.t_extraction:.4e} s, "
+                f"r = {self.r_extraction:.4e} m, "
+                f"K = {self.K_extraction:.4e} eV")
+
+
+def extraction_index(x, y, params):
+    """Return the index of the first sample out of the dees and the gap,
+    or on their outer boundary (within BOUNDARY_RTOL), after one inside
+    (None if the particle is never extracted), for params (charge, mass,
+    B field, E field, gap size, dee radius).
+    """
+    _, _, _, half_gap, d_r, d_r2 = cyclotron_fields._constants(params)
+    in_dees, in_gap = cyclotron_fields._regions(x, y, half_gap, d_r, d_r2)
+    # squared distance from the centre of the nearest dee (0 in the gap)
+    dx = np.maximum(np.abs(x) - half_gap, 0.0)
+    reached = dx*dx + y*y >= d_r2 * (1 - BOUNDARY_RTOL)
+    inside = (in_dees | in_gap) & ~reached
+    first = int(np.argmax(inside))
+    if not inside[first]:
+        return None
+    out = np.flatnonzero(~inside[first:])
+    return first + int(out[0]) if len(out) else None
+
+def gap_crossings(t, x, gap):
+    """Return the gap crossings of the samples t, x: the index of the last
+    sample before the gap, of the first one after it, the direction (+1
+    left to right) and the time of x = 0 (linear interpolation).
+    """
+    half_gap = gap/2
+    side = (x >= half_gap).astype(np.int8) - (x <= - half_gap)
+    in_dee = np.flatnonzero(side)
+    change = np.flatnonzero(side[in_dee[1:]] != side[in_dee[:-1]])
+    before = in_dee[change]
+    after = in_dee[change + 1]
+    direction = side[after].astype(int)
+    # first change of sign of x from the last sample before the gap
+    zero = np.flatnonzero(np.signbit(x[:-1]) != np.signbit(x[1:]))
+    i = zero[np.searchsorted(zero, before)]
+    t_crossing = t[i] + (t[i + 1] - t[i]) * x[i] / (x[i] - x[i + 1])
+    return before, after, direction, t_crossing
+
+def analyze(states, data, relativistic=False, ramp=0.0, extracted=None):
+    """Analyze the states (n, 5) of t, x, y, vx, vy of a run (e.g. from
+    cyclotron_recorder.load) for data in the order of
+    cyclotron_engine.DEFAULT_DATA (further values are ignored).
+    - relativistic -- kinetic energy and orbit radius with gamma
+    - ramp -- synchrocyclotron ramp of the square wave, see
+    cyclotron_fields.rf_phase
+    - extracted -- True if the run is known to end at the extraction
+    (e.g. Trajectory.extracted, stopped on the dee radius), default None
+    to detect it with extraction_index
+    Return an Analysis.
+    """
+    _, params = cyclotron_engine.split_data(data)
+    q, m, B, E, gap, d_r = params
+    t, x, y, vx, vy = (np.asarray(states[:, k]) for k in range(5))
+    end = extraction_index(x, y, params)
+    if end is None:
+        end = len(t) - 1
+        extracted = bool(extracted)
+    else:
+        extracted = True
+
+    before, after, direction, t_crossing = gap_crossings(
+        t[:end + 1], x[:end + 1], gap)
+
+    def kinetic(index):
+        return cyclotron_engine.monitors(vx[index], vy[index], q, m, B,
+                                         relativistic)["K"]
+
+    gain = kinetic(after) - kinetic(before)
+    # middle of the half period where q*E*square has the crossing direction
+    ideal = np.where(q*E*direction > 0, np.pi/2, 3*np.pi/2)
+    phase = cyclotron_fields.rf_phase(t_crossing, q*B/m, ramp) + np.pi/2
+    phase_slip = np.pi - (np.pi - (phase - ideal)) % (2*np.pi)
+
+    end_state = cyclotron_engine.monitors(vx[end], vy[end], q, m, B,
+                                          relativistic)
+    # orbit radius gamma*m*v/(|q|*B)
+    gamma = end_state["gamma"] if relativistic else 1.0
+    return Analysis(t_crossing=t_crossing, direction=direction,
+                    index_before=before, index_after=after, gain=gain,
+                    phase_slip=phase_slip, t_turn=t_crossing[::2],
+                    n_turns=len(t_crossing)//2, extracted=extracted,
+                    t_extraction=t[end],
+                    r_extraction=gamma*end_state["v"] / np.abs(q*B/m),
+                    K_extraction=end_state["K"])
+
+def analyze_trajectory(traj, ramp=0.0):
+    """Analyze a cyclotron_engine.Trajectory, return an Analysis."""
+    return analyze(np.column_stack([traj.t, traj.state]), traj.data,
+                   traj.relativistic, ramp, traj.extracted)
+
+def analyze_file(path, relativistic=False, ramp=0.0, extracted=None):
+    """Analyze the cyclotron_recorder file in path, return an Analysis
+    (extracted as in analyze).
+    """
+    data, _, states = cyclotron_recorder.load(path)
+    return analyze(states, data, relativistic, ramp, extracted)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Analyze a recorded cyclotron trajectory.")
+    parser.add_argument("inputfile", help="cyclotron_recorder file")
+    parser.add_argument("--relativistic", action="store_true",
+                        help="relativistic energies and radius")
+    args = parser.parse_args()
+    print(analyze_file(args.inputfile, args.relativistic).summary())
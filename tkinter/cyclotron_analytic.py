@@ -0,0 +1,287 @@
+"""Event-driven piecewise analytic propagator of the cyclotron.
+In each region of the field model (see cyclotron_fields) the equations of
+motion have an exact solution:
+- inside one of the dees (B field only): circular motion
+- inside the gap (B field and a constant E field between two flips of the
+  square wave): circular motion around the E x B drift
+- outside (no field): uniform linear motion
+so the particle is moved along these arcs from one event to the next,
+with no integration step at all. The events are the region changes,
+found by root finding (scipy.optimize.brentq) on the event functions
+along the arc, and the flips of the square wave, at the known times
+omega*t + pi/2 = k*pi. The result does not depend on a step size and has
+no artefacts at the gap boundaries x = +-gap/2.
+
+Only the event states (the nodes of the piecewise solution) are stored;
+the state at any time is computed exactly from the node before it
+(PiecewiseSolution). simulate() has the interface of
+cyclotron_engine.simulate and returns a cyclotron_engine.Trajectory.
+
+Example:
+    import cyclotron_analytic
+    traj = cyclotron_analytic.simulate(n_points=10000)
+    print(traj.extracted, traj.t_end, traj.K[-1])
+"""
+
+import math
+import numpy as np
+from scipy.optimize import brentq, minimize_scalar
+import cyclotron_engine
+import cyclotron_fields
+
+# regions of the field model
+LEFT_DEE, GAP, RIGHT_DEE, OUTSIDE = 0, 1, 2, 3
+REGION_NAMES = ("left dee", "gap", "right dee", "outside")
+
+def region_of(z, params):
+    """Return the region of the state z = (x, y, vx, vy), as in
+    cyclotron_fields (the dee boundaries x = +-gap/2 belong to the dees).
+    """
+    _, _, _, _, gap, d_r = params
+    x, y = z[0], z[1]
+    half_gap = gap/2
+    if x <= - half_gap and (x + half_gap)**2 + y**2 <= d_r**2:
+        return LEFT_DEE
+    if x >= half_gap and (x - half_gap)**2 + y**2 <= d_r**2:
+        return RIGHT_DEE
+    if - half_gap < x < half_gap and - d_r < y < d_r:
+        return GAP
+    return OUTSIDE
+
+def arc(z0, dt, w, a=0.0):
+    """Return the exact states at the times dt after the state z0 under
+    the accelerations ax = w*vy + a, ay = - w*vx (w = q/m*B, a = q/m*E),
+    shape (4,) + shape of dt. w = 0 is the uniform linear motion.
+    z0, w and a can be arrays broadcasting with dt (one per time).
+    """
+    x0, y0, vx0, vy0 = z0
+    if np.ndim(dt) == 0 and np.ndim(w) == 0 and np.ndim(x0) == 0:
+        return np.array(_arc_scalar(x0, y0, vx0, vy0, dt, w, a))
+    dt = np.asarray(dt, dtype=float)
+    w = np.asarray(w, dtype=float)
+    free = w == 0
+    w = np.where(free, 1.0, w)
+    drift = np.where(free, 0.0, a / w)
+    phase = w*dt
+    s = np.sin(phase)
+    one_minus_c = 2*np.sin(phase/2)**2 # 1 - cos(phase), no cancellation
+    c = 1 - one_minus_c
+    vd = vy0 + drift # vy in the frame of the E x B drift
+    x = np.where(free, x0 + vx0*dt, x0 + (vx0*s + vd*one_minus_c)/w)
+    y = np.where(free, y0 + vy0*dt,
+                 y0 - drift*dt + (vd*s - vx0*one_minus_c)/w)
+    vx = np.where(free, vx0, vx0*c + vd*s)
+    vy = np.where(free, vy0, vd*c - vx0*s - drift)
+    return np.array([x, y, vx, vy])
+
+def _arc_scalar(x0, y0, vx0, vy0, dt, w, a):
+    """arc for a single time, with the math module (root finding)."""
+    if w == 0:
+        return (x0 + vx0*dt, y0 + vy0*dt, vx0, vy0)
+    drift = a / w
+    phase = w*dt
+    s = math.sin(phase)
+    one_minus_c = 2*math.sin(phase/2)**2
+    vd = vy0 + drift
+    return (x0 + (vx0*s + vd*one_minus_c)/w,
+            y0 - drift*dt + (vd*s - vx0*one_minus_c)/w,
+            vx0*(1 - one_minus_c) + vd*s,
+            vd*(1 - one_minus_c) - vx0*s - drift)
+
+def square_wave(t, omega):
+    """Return the square wave scipy.signal.square(omega*t + pi/2) (+1 or
+    -1) at the scalar time t.
+    """
+    return 1.0 if (omega*t + math.pi/2) % (2*math.pi) < math.pi else -1.0
+
+def next_flip(t, omega):
+    """Return the first time after t where the square wave of frequency
+    omega flips (omega*t + pi/2 = k*pi), inf if omega = 0.
+    """
+    if omega == 0:
+        return math.inf
+    k = (omega*t + math.pi/2) / math.pi
+    k = math.floor(k) + 1 if omega > 0 else math.ceil(k) - 1
+    t_flip = (k*math.pi - math.pi/2) / omega
+    if t_flip <= t: # rounding
+        t_flip = ((k + np.sign(omega))*math.pi - math.pi/2) / omega
+    return t_flip
+
+
+class PiecewiseSolution:
+    """Piecewise analytic solution: the nodes (event times and states) and
+    the motion of each segment between two nodes.
+    Attributes:
+    - t -- node times, shape (n,)
+    - z -- node states, shape (n, 4)
+    - region -- region of the segment starting at each node, shape (n,)
+    - w, a -- q/m*B and q/m*E*square of each segment, shape (n,)
+    Calling it with an array of times t (within [t[0], t[-1]]) returns the
+    states, shape (4, len(t)), as a solve_ivp dense output.
+    """
+
+    def __init__(self, t, z, region, w, a):
+        self.t = np.asarray(t, dtype=float)
+        self.z = np.asarray(z, dtype=float).reshape(-1, 4)
+        self.region = np.asarray(region, dtype=int)
+        self.w = np.asarray(w, dtype=float)
+        self.a = np.asarray(a, dtype=float)
+
+    def __len__(self):
+        return len(self.t)
+
+    def __call__(self, t):
+        t = np.asarray(t, dtype=float)
+        i = np.clip(np.searchsorted(self.t, t, side='right') - 1,
+                    0, len(self.t) - 1)
+        return arc(self.z[i].T, t - self.t[i], self.w[i], self.a[i])
+
+
+def _first_crossing(events, z, w, a, horizon, step):
+    """Return (dt, k) of the first zero crossing within (0, horizon] of
+    the event functions events[k] = (g, direction) along the arc from z
+    (see arc), g computed from the states; (horizon, None) if there is
+    none. The functions are sampled every step and the crossings refined
+    with brentq.
+    """
+    n = max(int(math.ceil(horizon/step)), 1)
+    dts = np.linspace(0.0, horizon, n + 1)
+    states = arc(z, dts, w, a)
+    x0, y0, vx0, vy0 = z
+    best = (horizon, None)
+    for k, (g, direction) in enumerate(events):
+        values = g(states) * direction # crossing from < 0 to >= 0
+        crossed = np.flatnonzero((values[:-1] < 0) & (values[1:] >= 0))
+        if crossed.size == 0 or dts[crossed[0]] >= best[0]:
+            continue
+        i = crossed[0]
+        dt = brentq(lambda s: direction * g(_arc_scalar(x0, y0, vx0, vy0,
+                                                         s, w, a)),
+                    dts[i], dts[i + 1], xtol=1e-12*step)
+        if dt < best[0]:
+            best = (dt, k)
+    return best
+
+def propagate(z0, params, t_max, stop_when_extracted=True,
+              samples_per_turn=32, max_segments=10**6):
+    """Propagate the state z0 = (x, y, vx, vy) from t = 0 to t_max (or to
+    the extraction) for the given params (charge, mass, B field, E field,
+    gap size, dee radius), moving along the exact arcs between the events.
+    - stop_when_extracted -- stop when the particle goes out of the dee
+    radius (as the extraction event of cyclotron_engine)
+    - samples_per_turn -- samples of the event functions per turn, to
+    bracket their zeros
+    - max_segments -- raise RuntimeError beyond this number of segments
+    Return (PiecewiseSolution, extracted).
+    """
+    qmB, qmE, omega, half_gap, d_r, d_r2 = cyclotron_fields._constants(params)
+    if qmB == 0:
+        raise ValueError("the analytic propagator needs a non zero B field")
+    turn = 2*math.pi / abs(qmB)
+    step = turn / samples_per_turn
+
+    def radial(states, centre):
+        return (states[0] - centre)**2 + states[1]**2 - d_r2
+
+    def outer(states):
+        # squared distance from the segment x in [-gap/2, gap/2], y = 0
+        # minus d_r**2: < 0 in the dees and in the gap, convex along a line
+        dx = np.maximum(np.abs(states[0]) - half_gap, 0.0)
+        return dx**2 + states[1]**2 - d_r2
+
+    # events of each region: (g, direction, region entered)
+    events = {
+        LEFT_DEE: [(lambda s: s[0] + half_gap, 1, GAP),
+                   (lambda s: radial(s, - half_gap), 1, OUTSIDE)],
+        RIGHT_DEE: [(lambda s: s[0] - half_gap, -1, GAP),
+                    (lambda s: radial(s, half_gap), 1, OUTSIDE)],
+        GAP: [(lambda s: s[0] - half_gap, 1, RIGHT_DEE),
+              (lambda s: s[0] + half_gap, -1, LEFT_DEE),
+              (lambda s: s[1] - d_r, 1, OUTSIDE),
+              (lambda s: s[1] + d_r, -1, OUTSIDE)],
+    }
+
+    t = 0.0
+    z = np.array(z0, dtype=float)
+    region = region_of(z, params)
+    nodes_t, nodes_z, nodes_region, nodes_w, nodes_a = [], [], [], [], []
+    extracted = False
+    while True:
+        if region == OUTSIDE:
+            w, a, horizon = 0.0, 0.0, t_max - t
+        elif region == GAP:
+            t_flip = next_flip(t, omega)
+            w = qmB
+            a = qmE * square_wave((t + min(t_flip, t_max))/2, omega)
+            horizon = min(t_flip, t_max) - t
+        else: # the motion in a dee is periodic, one turn is enough
+            w, a, horizon = qmB, 0.0, min(turn, t_max - t)
+        nodes_t.append(t)
+        nodes_z.append(z)
+        nodes_region.append(region)
+        nodes_w.append(w)
+        nodes_a.append(a)
+        if len(nodes_t) > max_segments:
+            raise RuntimeError(f"more than {max_segments} segments")
+        if t >= t_max or (extracted and stop_when_extracted):
+            break
+
+        state = lambda dt, z=z, w=w, a=a: arc(z, dt, w, a)
+        if region == OUTSIDE:
+            # outer() is convex along the line: the particle enters again
+            # only before its minimum, if the minimum is < 0
+            g = lambda dt: outer(state(dt))
+            dt, new_region = horizon, None
+            if g(0.0) > 0:
+                t_min = minimize_scalar(g, bounds=(0.0, horizon),
+                                        method='bounded').x
+                if g(t_min) < 0:
+                    dt = brentq(g, 0.0, t_min, xtol=1e-12*step)
+                    x = state(dt)[0]
+                    new_region = (GAP if abs(x) < half_gap
+                                  else RIGHT_DEE if x > 0 else LEFT_DEE)
+        else:
+            dt, k = _first_crossing(
+                [(g, direction) for g, direction, _ in events[region]],
+                z, w, a, horizon, step)
+            new_region = None if k is None else events[region][k][2]
+
+        if region != GAP and new_region is None and horizon == turn:
+            # a whole turn inside a dee with no event: it never leaves it
+            dt = t_max - t
+        t_new = t + dt
+        z = state(dt)
+        if region == GAP and new_region is None and t_new < t_max:
+            t_new = t_flip # land on the flip time exactly
+        t = min(t_new, t_max)
+        if new_region is not None:
+            if new_region == OUTSIDE:
+                extracted = True
+            region = new_region
+    return (PiecewiseSolution(nodes_t, nodes_z, nodes_region, nodes_w,
+                              nodes_a), extracted)
+
+def simulate(data=cyclotron_engine.DEFAULT_DATA, t_max=None, n_points=None,
+             stop_when_extracted=True, samples_per_turn=32):
+    """Compute the trajectory of a particle in the cyclotron up to the
+    extraction or t_max with the piecewise analytic propagator.
+    - data -- (x0, y0, vx0, vy0, q, m, B, E, gap, dee radius)
+    - t_max -- time limit (s) (default None, 1000 cyclotron periods)
+    - n_points -- number of output times evenly spaced in [0, t_end]
+    (default None, the event nodes)
+    - stop_when_extracted, samples_per_turn -- see propagate
+    Return a cyclotron_engine.Trajectory, its solution is the
+    PiecewiseSolution.
+    """
+    z0, params = cyclotron_engine.split_data(data)
+    q, m, B = params[:3]
+    if t_max is None:
+        t_max = 1000 * cyclotron_engine.cyclotron_period(q, m, B)
+    solution, extracted = propagate(z0, params, t_max, stop_when_extracted,
+                                    samples_per_turn)
+    if n_points is None:
+        t, z = solution.t, solution.z.T
+    else:
+        t = np.linspace(0, solution.t[-1], n_points)
+        z = solution(t)
+    return cyclotron_engine.Trajectory(data[:10], t, z, extracted, solution)
@@ -0,0 +1,250 @@
+"""Headless cyclotron simulator, without Tk.
+Integrate a whole trajectory, from the initial conditions up to the
+extraction (the particle leaves the dees) or a time limit, in a single
+solve_ivp call with dense output, and return NumPy arrays of the state
+and of the monitors of the Cyclotron animation (T, v, p, K, gamma).
+It is meant for parameter studies on servers with no display.
+
+With relativistic=True the equations of motion are the relativistic ones
+(cyclotron_fields.derive_relativistic, momentum state), the monitors use
+gamma, and the square wave can follow a synchrocyclotron frequency ramp.
+The non relativistic model warns (RuntimeWarning) when gamma exceeds
+GAMMA_WARNING, where the particle drifts out of phase in reality.
+
+The data are given in the order of Cyclotron.default_data:
+(x0, y0, vx0, vy0, q, m, B, E, gap, dee radius), further values (length
+scale, fps) are ignored.
+
+method='boris' replaces solve_ivp with the fixed step, energy conserving
+Boris pusher of cyclotron_boris, for very long runs.
+
+Example:
+    import cyclotron_engine
+    traj = cyclotron_engine.simulate(cyclotron_engine.DEFAULT_DATA)
+    print(traj.extracted, traj.t[-1], traj.K[-1])
+"""
+
+import warnings
+import numpy as np
+from scipy.integrate import solve_ivp
+import cyclotron_boris
+import cyclotron_fields
+
+c = 2.99792458e8 # speed of light (m/s)
+qp = 1.602176e-19 # elementary charge (Coulomb)
+mp = 1.67262e-27 # proton mass (Kg)
+me = 9.10938e-31 # electron mass (Kg)
+
+# same defaults of Cyclotron.default_data (without length scale and fps)
+x0 = 0 # m
+y0 = 0 # m
+vx0 = 0 # m/s
+vy0 = 0 # m/s
+B0 = 1e-3 # T
+E0 = 1e1 # V/m
+gap0 = 0.02 # m
+dr0 = 0.45 # m
+DEFAULT_DATA = (x0, y0, vx0, vy0, qp, mp, B0, E0, gap0, dr0)
+DATA_NAMES = ("x0", "y0", "vx0", "vy0", "q", "m", "B", "E", "gap", "d_r")
+# gamma beyond which the non relativistic model is flagged
+GAMMA_WARNING = 1.001
+
+def split_data(data):
+    """Split data (in the order of DEFAULT_DATA) in the initial state
+    z0 = (x0, y0, vx0, vy0) and params = (q, m, B, E, gap, d_r).
+    """
+    data = tuple(float(value) for value in data[:10])
+    return data[:4], data[4:]
+
+def cyclotron_period(q, m, B):
+    """Return the (non relativistic) cyclotron period 2*pi*m/(|q|*B) (s)."""
+    return np.abs(2*np.pi*m / (q*B))
+
+def default_max_step(params):
+    """Return the default maximum solver step (s) for params (charge, mass,
+    B field, E field, gap size, dee radius): half the time to cross the gap
+    at the extraction speed, so no gap crossing is skipped, at most a
+    quarter of the cyclotron period.
+    """
+    q, m, B, E, gap, d_r = params
+    v_extraction = np.abs(q*B*d_r/m) # speed on the dee radius
+    return min(gap / (2*v_extraction), cyclotron_period(q, m, B)/4)
+
+def monitors(vx, vy, q, m, B, relativistic=False):
+    """Return the monitors of the Cyclotron animation for the velocities
+    vx, vy (arrays or scalars): dict of T (s), v (m/s), p (eV/c), K (eV)
+    and gamma, computed as in Cyclotron.monitors_update.
+    - relativistic -- relativistic p = gamma*m*v, K = (gamma - 1)*m*c**2
+    and period gamma*T
+    """
+    v = np.sqrt(vx**2 + vy**2)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        gamma = 1 / (np.sqrt(1 - (v/c)**2))
+    if relativistic:
+        p_eV = (gamma * v * m * c) / qp
+        K_eV = p_eV**2 / ((gamma + 1) * m * c**2 / qp) # (gamma - 1)*m*c**2
+        T = gamma * cyclotron_period(q, m, B)
+    else:
+        p_eV = (v * m * c) / qp # impulse of particle (eV/c)
+        K_eV = p_eV**2 / (2 * m * c**2 / qp)
+        T = np.full(np.shape(v), cyclotron_period(q, m, B))
+    return {"T": T, "v": v, "p": p_eV, "K": K_eV, "gamma": gamma}
+
+def make_extraction_event(params):
+    """Return the solve_ivp event of the extraction: the particle goes
+    out of the dee radius (terminal, crossing outward).
+    """
+    _, _, _, _, gap, d_r = params
+    half_gap = gap/2
+
+    def extraction(t, z):
+        # squared distance from the centre of the nearest dee (0 in the gap)
+        dx = max(abs(z[0]) - half_gap, 0.0)
+        return dx**2 + z[1]**2 - d_r**2
+
+    extraction.terminal = True
+    extraction.direction = 1
+    return extraction
+
+
+class Trajectory:
+    """Trajectory computed by simulate.
+    Attributes:
+    - t, x, y, vx, vy -- arrays of the solution at the output times
+    - T, v, p, K, gamma -- arrays of the monitors (see monitors)
+    - extracted -- True if the particle reached the dee radius
+    - relativistic -- True if computed with the relativistic model
+    - t_end -- final time (extraction time if extracted)
+    - data -- the data of the simulation (order of DEFAULT_DATA)
+    - solution -- dense output of solve_ivp, see sample(t)
+    """
+
+    def __init__(self, data, t, z, extracted, solution, relativistic=False):
+        self.data = tuple(data)
+        self.relativistic = relativistic
+        self.t = t
+        self.x, self.y, self.vx, self.vy = z
+        self.extracted = extracted
+        self.t_end = t[-1]
+        self.solution = solution
+        q, m, B = self.data[4:7]
+        for name, value in monitors(self.vx, self.vy, q, m, B,
+                                    relativistic).items():
+            setattr(self, name, value)
+
+    def __len__(self):
+        return len(self.t)
+
+    @property
+    def state(self):
+        """Array of the states (x, y, vx, vy), shape (len(t), 4)."""
+        return np.column_stack([self.x, self.y, self.vx, self.vy])
+
+    def sample(self, t):
+        """Return the states (x, y, vx, vy) at the times t (within
+        [0, t_end]) from the dense output, shape (len(t), 4).
+        """
+        return self.solution(np.asarray(t, dtype=float)).T
+
+
+def simulate(data=DEFAULT_DATA, t_max=None, n_points=None, method='RK45',
+             rtol=1e-8, atol=None, max_step=None, relativistic=False,
+             ramp=0.0, recorder=None):
+    """Integrate the trajectory of a particle in the cyclotron up to the
+    extraction or t_max, in one solve_ivp call with dense output.
+    - data -- (x0, y0, vx0, vy0, q, m, B, E, gap, dee radius)
+    - t_max -- time limit (s) (default None, 1000 cyclotron periods)
+    - n_points -- number of output times evenly spaced in [0, t_end]
+    sampled from the dense output (default None, the solver steps)
+    - method, rtol, atol -- solve_ivp options (default atol is 1e-12 of the
+    dee radius for the positions and of the extraction speed for the
+    velocities); method='boris' uses the Boris pusher (cyclotron_boris),
+    the solution is then linearly interpolated between the steps
+    - max_step -- maximum solver step (s) (default None,
+    default_max_step), the fixed step of 'boris' (default None,
+    cyclotron_boris.default_step)
+    - relativistic -- integrate the relativistic equations of motion
+    - ramp -- synchrocyclotron ramp of the square wave frequency (1/s),
+    see cyclotron_fields.rf_phase (relativistic only)
+    - recorder -- cyclotron_recorder.Recorder to append the output states
+    to (default None)
+    Return a Trajectory.
+    """
+    z0, params = split_data(data)
+    q, m, B, E, gap, d_r = params
+    period = cyclotron_period(q, m, B)
+    v_extraction = np.abs(q*B*d_r/m) # speed on the dee radius
+    if t_max is None:
+        t_max = 1000 * period
+    if ramp and not relativistic:
+        raise ValueError("the frequency ramp requires relativistic=True")
+    if method == 'boris':
+        traj = _simulate_boris(data, t_max, n_points, max_step,
+                               relativistic, ramp)
+        _check_gamma(traj)
+        _record(traj, recorder)
+        return traj
+    if max_step is None:
+        max_step = default_max_step(params)
+    if atol is None:
+        atol = 1e-12 * np.array([d_r, d_r, v_extraction, v_extraction])
+
+    if relativistic:
+        derive = cyclotron_fields.make_derive_relativistic(params, ramp)
+        z0 = cyclotron_fields.to_momentum(z0)
+    else:
+        derive = cyclotron_fields.make_derive(params)
+
+    sol = solve_ivp(derive, (0, t_max), z0,
+                    method=method, dense_output=True,
+                    events=make_extraction_event(params),
+                    rtol=rtol, atol=atol, max_step=max_step)
+    if sol.status < 0:
+        raise RuntimeError(f"integration failed: {sol.message}")
+    extracted = sol.status == 1
+    solution = sol.sol
+    if relativistic: # momentum to velocity
+        solution = lambda t: cyclotron_fields.to_velocity(sol.sol(t).T).T
+    if n_points is None:
+        t = sol.t
+        z = solution(t) if relativistic else sol.y
+    else:
+        t = np.linspace(0, sol.t[-1], n_points)
+        z = solution(t)
+    traj = Trajectory(data[:10], t, z, extracted, solution, relativistic)
+    _check_gamma(traj)
+    _record(traj, recorder)
+    return traj
+
+def _simulate_boris(data, t_max, n_points, dt, relativistic, ramp):
+    """simulate with method='boris', return a Trajectory."""
+    z0, params = split_data(data)
+    if dt is None:
+        dt = cyclotron_boris.default_step(params)
+    n_steps = int(np.ceil(t_max / dt))
+    # every step: the run usually stops at the extraction long before
+    # t_max, a stride from n_steps would save only a few states of it
+    t, z, extracted = cyclotron_boris.push(
+        z0, params, dt, n_steps, save_every=1,
+        stop_when_extracted=True, relativistic=relativistic, ramp=ramp)
+    t_steps, z_steps = t, z.T
+
+    def solution(t):
+        return np.array([np.interp(t, t_steps, zk) for zk in z_steps])
+
+    if n_points is not None:
+        t = np.linspace(0, t_steps[-1], n_points)
+        z = solution(t).T
+    return Trajectory(data[:10], t, z.T, extracted, solution, relativistic)
+
+def _record(traj, recorder):
+    """Append the states of traj to recorder (if not None)."""
+    if recorder is not None:
+        recorder.extend(np.column_stack([traj.t, traj.state]))
+
+def _check_gamma(traj):
+    """Warn if the non relativistic trajectory traj reaches high gamma."""
+    if not traj.relativistic and np.nanmax(traj.gamma) > GAMMA_WARNING:
+        warnings.warn(f"gamma reaches {np.nanmax(traj.gamma):.4f}, the non "
+                      "relativistic model ignores the loss of synchronism, "
+                      "use relativistic=True", RuntimeWarning)
@@ -0,0 +1,284 @@
+"""Ensemble integration of many cyclotron particles at once.
+The states of N particles are an (N, 4) array of x, y, vx, vy advanced
+together: the field model is cyclotron_fields.derive_array, where the
+regions (dees / gap / outside) are boolean masks, so each step costs a
+few NumPy operations on the whole array instead of N solver calls.
+
+Three schemes:
+- 'rk4' -- fixed step classical Runge-Kutta on the (N, 4) array
+- 'boris' -- fixed step Boris pusher (cyclotron_boris.step_array), energy
+  conserving for long runs
+- 'RK45' (or any solve_ivp method) -- adaptive solve_ivp on the
+  flattened (4N,) state, with the step shared by all the particles
+
+The values of data can also be arrays with one setting for each
+particle (see settings_states), so a parameter sweep of N settings is a
+single ensemble integration. With relativistic=True the relativistic
+model (cyclotron_fields.derive_relativistic) is integrated on the
+momenta, with an optional synchrocyclotron ramp; the saved states are
+still x, y, vx, vy.
+
+A particle is extracted the first time it leaves the dees outward (it
+is out of the dee radius and not in the gap); its time and kinetic
+energy at the extraction are recorded, then it keeps moving freely.
+With the fixed step schemes, a particle out of the dees that moves away
+from them (no field can reach it again, the dees and the gap are a
+convex region) leaves the integrated set: its free straight line motion
+is evaluated only at the saved times, so the steps cost less as the
+beam is extracted. The RK4 stages are written in buffers allocated once
+(derive_array out=), without temporaries.
+
+Example (beam spread):
+    import cyclotron_engine, cyclotron_ensemble
+    z0 = cyclotron_ensemble.scattered_states(10000, spread=(1e-3, 1e-3,
+                                             10, 10))
+    result = cyclotron_ensemble.integrate(z0, cyclotron_engine.DEFAULT_DATA)
+    print(result.extracted.mean(), result.K_extraction.std())
+"""
+
+import numpy as np
+from scipy.integrate import solve_ivp
+import cyclotron_boris
+import cyclotron_engine
+import cyclotron_fields
+
+def scattered_states(n, data=cyclotron_engine.DEFAULT_DATA,
+                     spread=(0, 0, 0, 0), seed=None):
+    """Return (n, 4) initial states, normally scattered around the
+    x0, y0, vx0, vy0 of data with standard deviations spread.
+    """
+    z0, _ = cyclotron_engine.split_data(data)
+    rng = np.random.default_rng(seed)
+    return np.asarray(z0) + rng.normal(size=(n, 4)) * np.asarray(spread)
+
+def settings_states(grid):
+    """Return the initial states (N, 4) and the data (tuple of arrays of
+    length N, order of DEFAULT_DATA) of a sequence of N settings (data
+    tuples, e.g. cyclotron_sweep.make_grid), for integrate.
+    """
+    table = np.array([tuple(data)[:10] for data in grid], dtype=float)
+    return table[:, :4], tuple(table.T)
+
+def _params(data):
+    """Return the params (q, m, B, E, gap, d_r) of data, floats or arrays."""
+    return tuple(float(value) if np.ndim(value) == 0
+                 else np.asarray(value, dtype=float) for value in data[4:10])
+
+def outside_dees(z, params):
+    """Return the boolean mask of the states z (..., 4) out of the dee
+    radius (outside both dees and the gap).
+    """
+    _, _, _, _, gap, d_r = params
+    x, y = z[..., 0], z[..., 1]
+    dx = np.maximum(np.abs(x) - gap/2, 0.0)
+    return dx**2 + y**2 > d_r**2
+
+def moving_away(z, params):
+    """Return the boolean mask of the states z (..., 4) whose velocity
+    points away from the dees and the gap (from the nearest point of this
+    convex region), so that without field they never enter it again.
+    """
+    _, _, _, _, gap, _ = params
+    x, y, vx, vy = z[..., 0], z[..., 1], z[..., 2], z[..., 3]
+    dx = np.copysign(np.maximum(np.abs(x) - gap/2, 0.0), x)
+    return dx*vx + y*vy >= 0
+
+def _take(values, index):
+    """Return the values (floats or arrays of N values) of the particles
+    index.
+    """
+    return tuple(value if np.ndim(value) == 0 else value[index]
+                 for value in values)
+
+
+class EnsembleResult:
+    """Result of integrate.
+    Attributes:
+    - t -- saved times, shape (n_saved,)
+    - states -- saved states, shape (n_saved, N, 4)
+    - extracted -- boolean mask of the extracted particles, shape (N,)
+    - t_extraction -- extraction time (nan if not extracted), shape (N,)
+    - K_extraction -- kinetic energy at the extraction (eV), shape (N,)
+    - final -- final states, shape (N, 4)
+    """
+
+    def __init__(self, t, states, extracted, t_extraction, K_extraction):
+        self.t = np.asarray(t)
+        self.states = np.asarray(states)
+        self.extracted = extracted
+        self.t_extraction = t_extraction
+        self.K_extraction = K_extraction
+        self.final = self.states[-1]
+
+
+def _rk4_step(derive, t, z, dt, work=None):
+    """Advance the (N, 4) states z by dt with the classical RK4 scheme,
+    in place. derive(t, z, out) writes the derivatives in out.
+    - work -- buffers of the stages, 5 arrays of the shape of z (default
+    None, allocated at each call)
+    """
+    if work is None:
+        work = [np.empty_like(z) for _ in range(5)]
+    k1, k2, k3, k4, zk = work
+    # same operations of z + dt/6*(k1 + 2*k2 + 2*k3 + k4), in the buffers
+    derive(t, z, k1)
+    np.add(z, np.multiply(k1, dt/2, out=zk), out=zk)
+    derive(t + dt/2, zk, k2)
+    np.add(z, np.multiply(k2, dt/2, out=zk), out=zk)
+    derive(t + dt/2, zk, k3)
+    np.add(z, np.multiply(k3, dt, out=zk), out=zk)
+    derive(t + dt, zk, k4)
+    k2 *= 2
+    k2 += k1
+    k3 *= 2
+    k2 += k3
+    k2 += k4
+    k2 *= dt/6
+    z += k2
+    return z
+
+def integrate(z0, data=cyclotron_engine.DEFAULT_DATA, t_max=None, dt=None,
+              method='rk4', save_every=100, stop_when_extracted=True,
+              relativistic=False, ramp=0.0, **solver_options):
+    """Integrate the (N, 4) initial states z0 with the parameters of data
+    (order of DEFAULT_DATA, the initial state in data is not used; each
+    parameter is a value or an array of N values).
+    - t_max -- time limit (s) (default None, 1000 cyclotron periods)
+    - dt -- time step of 'rk4' and 'boris' (default None, a quarter of the
+    time to cross the gap at the extraction speed for 'rk4',
+    cyclotron_boris.default_step for 'boris')
+    - method -- 'rk4', 'boris' or a solve_ivp method (e.g. 'RK45')
+    - save_every -- save the states every save_every steps ('rk4',
+    'boris'), or the number of evenly spaced saved times (solve_ivp)
+    - stop_when_extracted -- stop when all the particles are extracted
+    - relativistic -- integrate the relativistic equations of motion
+    - ramp -- synchrocyclotron ramp of the square wave frequency (1/s),
+    value or array of N values (relativistic only)
+    - solver_options -- further solve_ivp options (rtol, atol, max_step)
+    Return an EnsembleResult.
+    """
+    params = _params(data)
+    q, m, B, E, gap, d_r = params
+    # x, y, vx, vy columns contiguous in memory, faster masks and products
+    z = np.array(np.reshape(z0, (-1, 4)), dtype=float, order='F')
+    n = len(z)
+    period = cyclotron_engine.cyclotron_period(q, m, B)
+    v_extraction = np.abs(q*B*d_r/m)
+    if t_max is None:
+        t_max = 1000 * np.max(period)
+    if dt is None and method == 'boris':
+        dt = cyclotron_boris.default_step(params)
+    elif dt is None:
+        dt = min(np.min(gap / (4*v_extraction)), np.min(period)/8)
+    if relativistic:
+        def make_derive(params, ramp):
+            return lambda t, u, out=None: (
+                cyclotron_fields.derive_relativistic(t, u, params, ramp, out))
+        velocity = cyclotron_fields.to_velocity
+        z = np.asfortranarray(cyclotron_fields.to_momentum(z))
+    elif np.any(ramp):
+        raise ValueError("the frequency ramp requires relativistic=True")
+    else:
+        def make_derive(params, ramp):
+            return lambda t, z, out=None: (
+                cyclotron_fields.derive_array(t, z, params, out))
+        velocity = np.array
+
+    t_extraction = np.full(n, np.nan)
+    z_extraction = np.full((n, 4), np.nan)
+
+    def check_extraction(t, z, outside, index=slice(None)):
+        """Record the particles extracted at time t, z the states of the
+        particles index and outside their mask out of the dees (True for
+        all the remaining ones).
+        """
+        new = np.isnan(t_extraction[index]) & outside
+        if np.any(new):
+            new_index = np.arange(n)[index][new]
+            t_extraction[new_index] = t
+            z_extraction[new_index] = velocity(z[new])
+
+    if method in ('rk4', 'boris'):
+        # integrated particles; the others move freely from the state
+        # z_free (x, y, vx, vy) at the time t_free
+        active = np.arange(n)
+        active_params, active_ramp = params, ramp
+        derive = make_derive(params, ramp)
+        work = [np.empty_like(z) for _ in range(5)]
+        z_free = np.zeros((n, 4))
+        t_free = np.zeros(n)
+
+        def all_states(t):
+            """Return the (N, 4) states x, y, vx, vy at time t."""
+            states = z_free.copy()
+            states[:, :2] += (t - t_free)[:, None] * z_free[:, 2:]
+            states[active] = velocity(z)
+            return states
+
+        times = [0.0]
+        states = [velocity(z)]
+        t = 0.0
+        step = 0
+        while t < t_max:
+            h = min(dt, t_max - t)
+            if method == 'boris':
+                z = cyclotron_boris.step_array(z, t, h, active_params,
+                                               relativistic, active_ramp)
+            else:
+                z = _rk4_step(derive, t, z, h, work)
+            step += 1
+            t = step*dt if h == dt else t_max
+            outside = outside_dees(z, active_params)
+            check_extraction(t, z, outside, active)
+            done = stop_when_extracted and not np.isnan(t_extraction).any()
+            if step % save_every == 0 or t >= t_max or done:
+                times.append(t)
+                states.append(all_states(t))
+            if done:
+                break
+            # extracted particles (outside) moving away from the dees
+            free = outside
+            if np.any(free):
+                free &= moving_away(velocity(z), active_params)
+            if np.count_nonzero(free) > len(active) // 64: # compact
+                z_free[active[free]] = velocity(z[free])
+                t_free[active[free]] = t
+                active = active[~free]
+                active_params = _take(params, active)
+                active_ramp = _take((ramp,), active)[0]
+                derive = make_derive(active_params, active_ramp)
+                z = np.asfortranarray(z[~free])
+                work = [np.empty_like(z) for _ in range(5)]
+    else:
+        derive = make_derive(params, ramp)
+        solver_options.setdefault('max_step', 2*dt)
+
+        def fun(t, z_flat):
+            return derive(t, z_flat.reshape(n, 4)).ravel()
+
+        def all_extracted(t, z_flat):
+            # number of particles still inside, -0.5 when none is left
+            return (np.count_nonzero(~outside_dees(z_flat.reshape(n, 4),
+                                                   params)) - 0.5)
+        all_extracted.terminal = True
+
+        sol = solve_ivp(fun, (0, t_max), z.ravel(), method=method,
+                        dense_output=True,
+                        events=all_extracted if stop_when_extracted else None,
+                        **solver_options)
+        if sol.status < 0:
+            raise RuntimeError(f"integration failed: {sol.message}")
+        # extraction times at the solver steps
+        for t, z_flat in zip(sol.t, sol.y.T):
+            z = z_flat.reshape(n, 4)
+            check_extraction(t, z, outside_dees(z, params))
+        if sol.status == 1: # the last particles, at the terminal event
+            check_extraction(sol.t_events[0][0],
+                             sol.y_events[0][0].reshape(n, 4), True)
+        times = np.linspace(0, sol.t[-1], max(save_every, 2))
+        states = velocity(sol.sol(times).T.reshape(len(times), n, 4))
+
+    K = cyclotron_engine.monitors(z_extraction[:, 2], z_extraction[:, 3],
+                                  q, m, B, relativistic)["K"]
+    return EnsembleResult(times, states, ~np.isnan(t_extraction),
+                          t_extraction, K)
@@ -0,0 +1,313 @@
+"""Field model of the cyclotron: fast right-hand side of the equations of
+motion and its analytic Jacobian, for odeint / solve_ivp.
+
+Cyclotron.derive is generic: at every call it unpacks the parameters,
+recomputes q/m*B and the cyclotron frequency and calls scipy.signal.square
+on a scalar. make_derive(params) computes the constants once and returns
+a specialized function derive(t, z) with the same floating point
+operations in the same order, so the trajectories are bit for bit the
+same of Cyclotron.derive. The square wave is evaluated inline, as
+scipy.signal.square does: +1 if (omega*t + pi/2) mod 2*pi < pi, else -1.
+
+If numba is installed, make_derive(params, compiled=True) returns the
+same model compiled with numba (_derive_kernel, compiled once for all the
+params, returning an array: a list built in compiled code is converted
+back to Python at every call, which is slower than the plain function).
+
+derive_array(t, z, params) is the branch-free form of the same model on
+arrays: z has shape (..., 4) (e.g. N particles or N samples of a
+trajectory), t is a scalar or broadcasts with z[..., 0], the regions
+are boolean masks.
+
+derive_relativistic(t, z, params, ramp) is the relativistic model on
+arrays, with the state z = (x, y, ux, uy), u = gamma*v the momentum per
+unit rest mass: the cyclotron frequency of the particle q*B/(gamma*m)
+decreases with the energy, while the square wave keeps the frequency
+omega = q*B/m, or follows a linear synchrocyclotron ramp (rf_phase).
+The params can be arrays (one setting for each state), for sweeps;
+make_derive_relativistic(params, ramp) is its scalar form for a single
+particle.
+
+Regions (as in Cyclotron.derive):
+- inside one of the dees: magnetic field only
+- inside the gap: magnetic field and square wave electric field along x
+- outside: no field
+"""
+
+import math
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError: # numba is optional
+    njit = None
+
+def _constants(params):
+    """Return the constants of the field model for params
+    (charge, mass, B field, E field, gap size, dee radius).
+    """
+    q, m, B, E, gap, d_r = params
+    return (q/m * B, # q/m*B, as ((q/m)*B)*v in Cyclotron.derive
+            q/m * E, # q/m*E, as ((q/m)*E)*square
+            q*B/m, # cyclotron frequency omega
+            gap/2,
+            d_r,
+            d_r**2)
+
+def _derive_kernel(t, z, qmB, qmE, omega, half_gap, d_r, d_r2):
+    """Kernel of make_derive(params, compiled=True): the same operations
+    of make_derive, with the constants as arguments and an array result.
+    """
+    x, y, vx, vy = z[0], z[1], z[2], z[3]
+    derivs = np.empty(4)
+    derivs[0] = vx
+    derivs[1] = vy
+    if ( # inside one of the dees, E_field = 0
+        ((x <= - half_gap) and ((x + half_gap)**2 + (y)**2 <= d_r2))
+        or
+        ((x >= + half_gap) and ((x - half_gap)**2 + (y)**2 <= d_r2))
+        ):
+        derivs[2] = qmB * vy
+        derivs[3] = - (qmB * vx)
+    elif ( # inside the gap, E_field != 0
+        (x > - half_gap) and (x < half_gap) and (y > - d_r) and (y < d_r)
+        ):
+        if (omega*t + math.pi/2) % (2*math.pi) < math.pi:
+            square = 1.0
+        else:
+            square = -1.0
+        derivs[2] = qmB * vy + qmE * square
+        derivs[3] = - (qmB * vx)
+    else: # outer region, E_field = 0, B_field = 0
+        derivs[2] = 0.0
+        derivs[3] = 0.0
+    return derivs
+
+_derive_compiled = None
+
+def make_derive(params, compiled=False):
+    """Return derive(t, z), the derivative of z = (x, y, vx, vy) at time t
+    for the given params (charge, mass, B field, E field, gap size,
+    dee radius), with the constants computed once.
+    - compiled -- use the numba kernel _derive_kernel (requires numba),
+    the result is then an array
+    """
+    global _derive_compiled
+    qmB, qmE, omega, half_gap, d_r, d_r2 = _constants(params)
+    if compiled:
+        if njit is None:
+            raise ImportError("compiled=True requires numba")
+        if _derive_compiled is None:
+            _derive_compiled = njit(_derive_kernel)
+        kernel = _derive_compiled
+        return lambda t, z: kernel(t, z, qmB, qmE, omega, half_gap, d_r,
+                                   d_r2)
+    two_pi = 2*math.pi
+    half_pi = math.pi/2
+
+    def derive(t, z):
+        x, y, vx, vy = z[0], z[1], z[2], z[3]
+        if ( # inside one of the dees, E_field = 0
+            ((x <= - half_gap) and ((x + half_gap)**2 + (y)**2 <= d_r2))
+            or
+            ((x >= + half_gap) and ((x - half_gap)**2 + (y)**2 <= d_r2))
+            ):
+            ax = qmB * vy
+            ay = - (qmB * vx)
+        elif ( # inside the gap, E_field != 0
+            (x > - half_gap) and (x < half_gap) and (y > - d_r) and (y < d_r)
+            ):
+            # square wave of scipy.signal.square(omega*t + pi/2)
+            if (omega*t + half_pi) % two_pi < math.pi:
+                square = 1.0
+            else:
+                square = -1.0
+            ax = qmB * vy + qmE * square
+            ay = - (qmB * vx)
+        else: # outer region, E_field = 0, B_field = 0
+            ax = 0.0
+            ay = 0.0
+        return [vx, vy, ax, ay]
+
+    return derive
+
+c = 2.99792458e8 # speed of light (m/s)
+
+def _regions(x, y, half_gap, d_r, d_r2):
+    """Return the boolean masks in_dees, in_gap of the positions x, y."""
+    # |x| - half_gap is exactly -(x + half_gap) on the left dee and
+    # x - half_gap on the right one, so the masks are the ones of
+    # Cyclotron.derive
+    dx = np.abs(x) - half_gap
+    in_dees = (dx >= 0) & (dx*dx + y*y <= d_r2)
+    in_gap = (dx < 0) & (np.abs(y) < d_r)
+    return in_dees, in_gap
+
+def _square(phase):
+    """Return scipy.signal.square(phase + pi/2) (scalar or array)."""
+    if np.ndim(phase) == 0:
+        return 1.0 if (phase + math.pi/2) % (2*math.pi) < math.pi else -1.0
+    return np.where(np.mod(phase + math.pi/2, 2*math.pi) < math.pi, 1.0, -1.0)
+
+def rf_phase(t, omega, ramp=0.0):
+    """Return the phase of the accelerating square wave at time t:
+    omega*t, or with a synchrocyclotron ramp (ramp != 0) of the frequency
+    omega*(1 - ramp*t) (ramp in 1/s), the phase omega*(t - ramp*t**2/2).
+    """
+    if np.ndim(ramp) == 0 and ramp == 0:
+        return omega*t
+    return omega*(t - ramp*t**2/2)
+
+def gamma_factor(ux, uy):
+    """Return the Lorentz factor of the momenta per unit rest mass ux, uy
+    (m/s).
+    """
+    return np.sqrt(1 + (ux**2 + uy**2)/c**2)
+
+def to_momentum(z):
+    """Return the states (x, y, ux, uy) of the states z (..., 4) of
+    x, y, vx, vy.
+    """
+    z = np.asarray(z, dtype=float)
+    u = np.array(z, dtype=float)
+    gamma = 1/np.sqrt(1 - (z[..., 2]**2 + z[..., 3]**2)/c**2)
+    u[..., 2:] *= gamma[..., np.newaxis]
+    return u
+
+def to_velocity(u):
+    """Return the states (x, y, vx, vy) of the states u (..., 4) of
+    x, y, ux, uy.
+    """
+    z = np.array(u, dtype=float)
+    gamma = gamma_factor(z[..., 2], z[..., 3])
+    z[..., 2:] /= gamma[..., np.newaxis]
+    return z
+
+def _new_derivs(out, z, *shapes):
+    """Return out, or a new array for the derivatives of z broadcast with
+    the arrays of shapes, with x, y, vx, vy contiguous in memory (as in
+    z.T of a (4, N) array).
+    """
+    if out is not None:
+        return out
+    shape = np.broadcast_shapes(z.shape, *(shape + (4,) for shape in shapes))
+    return np.moveaxis(np.empty((4,) + shape[:-1]), 0, -1)
+
+def _apply_fields(derivs, vx, vy, qmB, qmE_square, in_dees, in_gap):
+    """Write the accelerations of the velocities vx, vy in derivs[..., 2:]
+    in place: magnetic in the dees and the gap, plus qmE_square in the
+    gap, none outside (the values of the np.where of Cyclotron.derive).
+    """
+    ax, ay = derivs[..., 2], derivs[..., 3]
+    np.multiply(qmB, vy, out=ax)
+    np.multiply(qmB, vx, out=ay)
+    np.negative(ay, out=ay)
+    outside = in_dees
+    outside |= in_gap
+    np.logical_not(outside, out=outside)
+    np.copyto(ax, 0.0, where=outside)
+    np.copyto(ay, 0.0, where=outside)
+    np.add(ax, qmE_square, out=ax, where=in_gap)
+
+def derive_array(t, z, params, out=None):
+    """Return the derivatives of the states z (array of shape (..., 4) of
+    x, y, vx, vy) at the times t (scalar or array broadcasting with
+    z[..., 0]), as an array of the shape of z.
+    params contains: charge, mass, B field, E field, gap size, dee radius.
+    params can also be arrays broadcasting with z[..., 0].
+    Same values of make_derive(params) for each state.
+    - out -- array of the shape of the result to write the derivatives
+    in (default None, a new array), e.g. the stages of a fixed step scheme
+    """
+    qmB, qmE, omega, half_gap, d_r, d_r2 = _constants(params)
+    z = np.asarray(z, dtype=float)
+    x, y, vx, vy = z[..., 0], z[..., 1], z[..., 2], z[..., 3]
+    in_dees, in_gap = _regions(x, y, half_gap, d_r, d_r2)
+    square = _square(omega*np.asarray(t))
+    derivs = _new_derivs(out, z, np.shape(t), np.shape(qmB))
+    derivs[..., 0] = vx
+    derivs[..., 1] = vy
+    _apply_fields(derivs, vx, vy, qmB, qmE * square, in_dees, in_gap)
+    return derivs
+
+def derive_relativistic(t, z, params, ramp=0.0, out=None):
+    """Return the derivatives of the states z (array of shape (..., 4) of
+    x, y, ux, uy, u = gamma*v in m/s) at the times t (scalar or array
+    broadcasting with z[..., 0]) with the relativistic equations of motion
+    du/dt = q/m*(E + v x B), dx/dt = u/gamma.
+    params contains: charge, mass, B field, E field, gap size, dee radius
+    (scalars or arrays broadcasting with z[..., 0]).
+    - ramp -- synchrocyclotron ramp of the square wave frequency, see
+    rf_phase (default 0, fixed frequency q*B/m)
+    - out -- array to write the derivatives in, see derive_array
+    """
+    qmB, qmE, omega, half_gap, d_r, d_r2 = _constants(params)
+    z = np.asarray(z, dtype=float)
+    x, y, ux, uy = z[..., 0], z[..., 1], z[..., 2], z[..., 3]
+    in_dees, in_gap = _regions(x, y, half_gap, d_r, d_r2)
+    square = _square(rf_phase(t, omega, ramp))
+    derivs = _new_derivs(out, z, np.shape(t), np.shape(qmB), np.shape(ramp))
+    gamma = gamma_factor(ux, uy)
+    vx = np.divide(ux, gamma, out=derivs[..., 0])
+    vy = np.divide(uy, gamma, out=derivs[..., 1])
+    _apply_fields(derivs, vx, vy, qmB, qmE * square, in_dees, in_gap)
+    return derivs
+
+def make_derive_relativistic(params, ramp=0.0):
+    """Return derive(t, u), the scalar form of derive_relativistic for a
+    single state u = (x, y, ux, uy) and the given params, with the
+    constants computed once (as make_derive).
+    """
+    qmB, qmE, omega, half_gap, d_r, d_r2 = _constants(params)
+    two_pi = 2*math.pi
+    half_pi = math.pi/2
+    c2 = c**2
+
+    def derive(t, u):
+        x, y, ux, uy = u[0], u[1], u[2], u[3]
+        gamma = math.sqrt(1 + (ux**2 + uy**2)/c2)
+        vx = ux/gamma
+        vy = uy/gamma
+        if (((x <= - half_gap) and ((x + half_gap)**2 + (y)**2 <= d_r2))
+            or ((x >= + half_gap) and ((x - half_gap)**2 + (y)**2 <= d_r2))):
+            ax = qmB * vy
+            ay = - (qmB * vx)
+        elif (x > - half_gap) and (x < half_gap) and (y > - d_r) and (y < d_r):
+            phase = rf_phase(t, omega, ramp)
+            square = 1.0 if (phase + half_pi) % two_pi < math.pi else -1.0
+            ax = qmB * vy + qmE * square
+            ay = - (qmB * vx)
+        else:
+            ax = 0.0
+            ay = 0.0
+        return [vx, vy, ax, ay]
+
+    return derive
+
+def make_jacobian(params):
+    """Return jacobian(t, z), the analytic Jacobian d(derive)/dz of the
+    function returned by make_derive(params), as odeint Dfun (with
+    tfirst=True) or solve_ivp jac.
+    The field is uniform inside each region, so the Jacobian depends only
+    on the region (the jumps at the region boundaries are not included).
+    """
+    qmB, _, _, half_gap, d_r, d_r2 = _constants(params)
+    field = [[0.0, 0.0, 1.0, 0.0],
+             [0.0, 0.0, 0.0, 1.0],
+             [0.0, 0.0, 0.0, qmB],
+             [0.0, 0.0, -qmB, 0.0]]
+    free = [[0.0, 0.0, 1.0, 0.0],
+            [0.0, 0.0, 0.0, 1.0],
+            [0.0, 0.0, 0.0, 0.0],
+            [0.0, 0.0, 0.0, 0.0]]
+
+    def jacobian(t, z):
+        x, y = z[0], z[1]
+        if (((x <= - half_gap) and ((x + half_gap)**2 + (y)**2 <= d_r2))
+            or ((x >= + half_gap) and ((x - half_gap)**2 + (y)**2 <= d_r2))
+            or ((x > - half_gap) and (x < half_gap)
+                and (y > - d_r) and (y < d_r))):
+            return field
+        return free
+
+    return jacobian
@@ -0,0 +1,87 @@
+"""Playback of a precomputed cyclotron trajectory.
+The whole trajectory is computed up front, in a background thread, by the
+headless solver (cyclotron_engine.simulate) with dense output; the
+animation then only samples it at the frame times, at any speed, and can
+seek to any time instantly (no integration from the start).
+
+Example:
+    playback = Playback(cyclotron_engine.DEFAULT_DATA)
+    playback.wait()
+    x, y, vx, vy = playback.state(1e-3)
+"""
+
+import threading
+import numpy as np
+import cyclotron_engine
+
+class Playback:
+    """Trajectory computed in the background for the playback.
+    - data -- (x0, y0, vx0, vy0, q, m, B, E, gap, dee radius, ...)
+    - background -- compute in a thread (default True), see ready, wait
+    - options -- further cyclotron_engine.simulate options (t_max,
+    method, relativistic, ...)
+    """
+
+    def __init__(self, data, background=True, **options):
+        self.data = tuple(float(value) for value in data[:10])
+        self.options = options
+        self.trajectory = None # cyclotron_engine.Trajectory when ready
+        self.error = None # exception raised by the solver, if any
+        self._done = threading.Event()
+        if background:
+            threading.Thread(target=self._compute, daemon=True).start()
+        else:
+            self._compute()
+
+    def _compute(self):
+        try:
+            self.trajectory = cyclotron_engine.simulate(self.data,
+                                                        **self.options)
+        except Exception as error: # reported by wait / ready
+            self.error = error
+        self._done.set()
+
+    def matches(self, data, **options):
+        """Return True if the playback is for data and options."""
+        return (self.data == tuple(float(value) for value in data[:10])
+                and self.options == options)
+
+    @property
+    def ready(self):
+        """True when the trajectory is computed (raise the solver error)."""
+        if self._done.is_set() and self.error is not None:
+            raise self.error
+        return self.trajectory is not None
+
+    def wait(self, timeout=None):
+        """Wait for the trajectory, return ready."""
+        self._done.wait(timeout)
+        return self.ready
+
+    @property
+    def duration(self):
+        """Final time of the trajectory (s)."""
+        return self.trajectory.t_end
+
+    @property
+    def period(self):
+        """Cyclotron period of the trajectory (s)."""
+        q, m, B = self.data[4:7]
+        return cyclotron_engine.cyclotron_period(q, m, B)
+
+    def state(self, t):
+        """Return the state x, y, vx, vy at time t, clipped to
+        [0, duration].
+        """
+        t = min(max(t, 0.0), self.duration)
+        return tuple(self.trajectory.sample([t])[0])
+
+    def states(self, t0, t1, step):
+        """Return the times in (t0, t1] every step at most (t1 included,
+        clipped to [0, duration]) and the states there, shape (n, 4).
+        """
+        t0 = min(max(t0, 0.0), self.duration)
+        t1 = min(max(t1, 0.0), self.duration)
+        n = max(int(np.ceil((t1 - t0) / step)), 1)
+        t = np.linspace(t0, t1, n + 1)[1:]
+        return t, self.trajectory.sample(t)
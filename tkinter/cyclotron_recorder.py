@@ -0,0 +1,151 @@
+"""Recorder of cyclotron trajectories in a compact binary file.
+The states (t, x, y, vx, vy) are appended to a preallocated float64 array,
+which doubles its capacity when full, and flushed in chunks to a raw
+binary file, so long runs (GUI or headless) are kept without Python lists
+and read back memory-mapped for post-processing.
+
+File layout (little endian):
+- MAGIC (8 bytes)
+- header: N_DATA + 2 float64, the data in the order of
+  Cyclotron.default_data (x0, y0, vx0, vy0, q, m, B, E, gap, dee radius,
+  length scale, fps; NaN if missing, e.g. headless runs), the timescale
+  (NaN for headless runs) and the number of columns
+- the rows of the states, float64, len(COLUMNS) values each
+The number of rows follows from the size of the file, so a file is
+readable while it is recorded (up to the last flush).
+
+Example:
+    with Recorder("run.cyc", data, timescale) as recorder:
+        recorder.append(t, x, y, vx, vy) # every step
+    data, timescale, states = load("run.cyc") # states memory-mapped
+"""
+
+import numpy as np
+
+MAGIC = b"CYCTRJ1\n"
+COLUMNS = ("t", "x", "y", "vx", "vy")
+N_DATA = 12 # values of Cyclotron.default_data
+HEADER_SIZE = len(MAGIC) + 8*(N_DATA + 2)
+
+class Recorder:
+    """Recorder of the states (t, x, y, vx, vy) of a run.
+    - path -- output file (None to keep the states in memory only)
+    - data -- data of the run in the order of Cyclotron.default_data
+    (headless data of 10 values are padded with NaN)
+    - timescale -- timescale of the animation (default NaN, headless)
+    - chunk_size -- rows buffered before each write to the file
+    """
+
+    def __init__(self, path=None, data=(), timescale=np.nan,
+                 chunk_size=4096):
+        self.path = path
+        self.data = np.full(N_DATA, np.nan)
+        data = np.asarray(data, dtype=float)[:N_DATA]
+        self.data[:len(data)] = data
+        self.timescale = float(timescale)
+        self.chunk_size = chunk_size
+        self._rows = np.empty((chunk_size, len(COLUMNS)))
+        self._size = 0 # rows in the buffer
+        self.n_flushed = 0 # rows written to the file
+        self._file = None
+        if path is not None:
+            self._file = open(path, 'wb')
+            self._file.write(MAGIC)
+            self._file.write(np.concatenate(
+                [self.data, [self.timescale, len(COLUMNS)]]).astype('<f8')
+                .tobytes())
+
+    def __len__(self):
+        """Number of recorded rows."""
+        return self.n_flushed + self._size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def states(self):
+        """Rows (n, 5) kept in memory (all of them if path is None, the
+        ones not flushed yet otherwise).
+        """
+        return self._rows[:self._size]
+
+    def append(self, t, x, y, vx, vy):
+        """Record the state at time t."""
+        if self._size == len(self._rows):
+            self._make_room(1)
+        self._rows[self._size] = (t, x, y, vx, vy)
+        self._size += 1
+        if self._file is not None and self._size >= self.chunk_size:
+            self.flush()
+
+    def extend(self, rows):
+        """Record the states rows, array (n, 5) of t, x, y, vx, vy."""
+        rows = np.asarray(rows, dtype=float).reshape(-1, len(COLUMNS))
+        if self._size + len(rows) > len(self._rows):
+            self._make_room(len(rows))
+        self._rows[self._size:self._size + len(rows)] = rows
+        self._size += len(rows)
+        if self._file is not None and self._size >= self.chunk_size:
+            self.flush()
+
+    def _make_room(self, n):
+        """Double the capacity of the buffer until n more rows fit."""
+        capacity = len(self._rows)
+        while capacity < self._size + n:
+            capacity *= 2
+        rows = np.empty((capacity, len(COLUMNS)))
+        rows[:self._size] = self._rows[:self._size]
+        self._rows = rows
+
+    def flush(self):
+        """Write the buffered rows to the file (nothing without path)."""
+        if self._file is None or self._size == 0:
+            return
+        self._file.write(self._rows[:self._size].astype('<f8').tobytes())
+        self._file.flush()
+        self.n_flushed += self._size
+        self._size = 0
+
+    def close(self):
+        """Flush and close the file."""
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+
+def read_header(path):
+    """Return the data (N_DATA values) and the timescale of the recording
+    in path.
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a cyclotron recording")
+        header = np.frombuffer(f.read(8*(N_DATA + 2)), dtype='<f8')
+    if header[-1] != len(COLUMNS):
+        raise ValueError(f"{path}: unexpected number of columns "
+                         f"{header[-1]:g}")
+    return header[:N_DATA].copy(), float(header[N_DATA])
+
+def load(path, mmap_mode='r'):
+    """Read the recording in path, return the data, the timescale and the
+    states (n, 5) of t, x, y, vx, vy, memory-mapped with np.memmap mode
+    mmap_mode (None to read them in memory).
+    """
+    data, timescale = read_header(path)
+    with open(path, 'rb') as f:
+        f.seek(0, 2)
+        n_rows = (f.tell() - HEADER_SIZE) // (8*len(COLUMNS))
+    if mmap_mode is None:
+        states = np.fromfile(path, dtype='<f8', count=n_rows*len(COLUMNS),
+                             offset=HEADER_SIZE).reshape(n_rows,
+                                                         len(COLUMNS))
+    elif n_rows == 0:
+        states = np.empty((0, len(COLUMNS)))
+    else:
+        states = np.memmap(path, dtype='<f8', mode=mmap_mode,
+                           offset=HEADER_SIZE, shape=(n_rows, len(COLUMNS)))
+    return data, timescale, states
@@ -0,0 +1,231 @@
+"""Parameter sweep of the cyclotron: run the headless simulator
+(cyclotron_engine) on a grid of settings in parallel across processes
+and write one results table with a row for each setting.
+
+The grid is the Cartesian product of the values of each parameter, in
+the order of Cyclotron.default_data (x0, y0, vx0, vy0, q, m, B, E, gap,
+d_r); the parameters not given keep their default. Each row of the
+results (.csv) holds the index of the setting in the grid, its data, the
+model (relativistic flag and time limit, nan for the default), the
+extraction flag, the final time, the final kinetic energy (eV), the
+number of turns, the final radius and the error of the setting (empty if
+none: a setting whose simulation raises gets nan results and the
+exception in this column, the sweep goes on).
+The results file is also the checkpoint: rows are written as soon as
+they are computed, and a sweep started again on the same file skips the
+settings already done, so an interrupted sweep does not restart from
+scratch. A sweep refuses to resume a file whose rows have other data or
+another model than its grid.
+
+Command line usage:
+    python cyclotron_sweep.py results.csv B=1e-3:2e-3:11 E=5,10,20
+    (name=start:stop:num for evenly spaced values, name=v1,v2,... for a
+    list, see parse_values)
+"""
+
+import argparse
+import csv
+import itertools
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import cyclotron_engine
+
+MODEL_NAMES = ("relativistic", "t_max")
+RESULT_NAMES = ("extracted", "t_end", "K", "turns", "r_end")
+COLUMNS = (("index",) + cyclotron_engine.DATA_NAMES + MODEL_NAMES
+           + RESULT_NAMES + ("error",))
+
+def parse_values(text):
+    """Return the values of a parameter from text:
+    'start:stop:num' for num evenly spaced values (np.linspace),
+    'v1,v2,...' for a list of values.
+    """
+    if ':' in text:
+        start, stop, num = text.split(':')
+        return list(np.linspace(float(start), float(stop), int(num)))
+    return [float(value) for value in text.split(',')]
+
+def make_grid(**values):
+    """Return the grid of settings, the Cartesian product of values
+    (name -> sequence of values, names as in cyclotron_engine.DATA_NAMES),
+    as an iterator of data tuples in the order of DEFAULT_DATA, and the
+    number of settings.
+    """
+    unknown = set(values) - set(cyclotron_engine.DATA_NAMES)
+    if unknown:
+        raise ValueError(f"unknown parameters {sorted(unknown)}, use "
+                         f"{cyclotron_engine.DATA_NAMES}")
+    axes = [values.get(name, (default,)) for name, default
+            in zip(cyclotron_engine.DATA_NAMES, cyclotron_engine.DEFAULT_DATA)]
+    size = int(np.prod([len(axis) for axis in axes]))
+    return itertools.product(*axes), size
+
+def count_turns(x):
+    """Return the number of turns of a trajectory, half the number of
+    crossings of the gap (sign changes of x).
+    """
+    return np.count_nonzero(np.diff(np.signbit(x))) / 2
+
+def run_setting(data, t_max=None, relativistic=False):
+    """Simulate one setting and return its results, in the order of
+    RESULT_NAMES.
+    - relativistic -- use the relativistic model of cyclotron_engine
+    """
+    traj = cyclotron_engine.simulate(data, t_max=t_max,
+                                     relativistic=relativistic)
+    return (int(traj.extracted), traj.t_end, traj.K[-1], count_turns(traj.x),
+            np.hypot(traj.x[-1], traj.y[-1]))
+
+def _model(t_max, relativistic):
+    """Return the model columns of the rows, in the order of MODEL_NAMES."""
+    return (int(relativistic), np.nan if t_max is None else float(t_max))
+
+def _run_safe(data, t_max, relativistic):
+    """Return the results of run_setting and the error ('' if none): nan
+    results and the exception if the simulation raises.
+    """
+    try:
+        return run_setting(data, t_max, relativistic) + ('',)
+    except Exception as error: # e.g. q = 0, failed integration
+        message = " ".join(f"{type(error).__name__}: {error}".split())
+        return (np.nan,)*len(RESULT_NAMES) + (message,)
+
+def _run_chunk(chunk, t_max, relativistic=False):
+    """Run a chunk of (index, data) in a worker, return the result rows."""
+    return [(index,) + tuple(data) + _model(t_max, relativistic)
+            + _run_safe(data, t_max, relativistic)
+            for index, data in chunk]
+
+def _done_rows(outputfile):
+    """Return the settings already in the results file, as a dict index ->
+    data and model values, dropping an incomplete last line (interrupted
+    write). Return None if the file is missing, or has no header and no
+    rows (a new file is written).
+    """
+    if not os.path.exists(outputfile):
+        return None
+    with open(outputfile, 'r+', newline='') as f:
+        lines = f.readlines()
+        if lines and not lines[-1].endswith('\n'):
+            lines.pop()
+            f.seek(0)
+            f.writelines(lines)
+            f.truncate()
+    if not lines:
+        return None
+    if next(csv.reader(lines[:1])) != list(COLUMNS):
+        raise ValueError(f"{outputfile} is not a results file of this "
+                         "sweep (unexpected header)")
+    n_settings = len(cyclotron_engine.DATA_NAMES) + len(MODEL_NAMES)
+    return {int(row[0]): tuple(float(value) for value
+                               in row[1:1 + n_settings])
+            for row in csv.reader(lines[1:]) if len(row) == len(COLUMNS)}
+
+def _check_resume(done, grid, model, outputfile):
+    """Raise ValueError if a row done (see _done_rows) has other data than
+    the setting of its index in grid (a list) or another model.
+    """
+    for index, settings in done.items():
+        expected = (tuple(float(value) for value in grid[index]) + model
+                    if index < len(grid) else None)
+        if expected is None or not np.array_equal(settings, expected,
+                                                  equal_nan=True):
+            raise ValueError(f"{outputfile} holds setting {index} with "
+                             "other data or model than this sweep, use "
+                             "another results file")
+
+def run_sweep(grid, outputfile, workers=None, t_max=None, chunksize=16,
+              relativistic=False):
+    """Run the settings of grid (iterable of data tuples, see make_grid)
+    in parallel and append the result rows to outputfile (.csv), skipping
+    the settings already in it. Return the number of settings run.
+    - workers -- number of worker processes (default None, one for each
+    CPU), workers=1 runs in this process
+    - t_max -- time limit of each simulation, see cyclotron_engine.simulate
+    - chunksize -- number of settings sent to a worker at a time
+    - relativistic -- use the relativistic model (see run_setting)
+    Raise ValueError if outputfile holds rows of another grid or model.
+    """
+    done = _done_rows(outputfile)
+    new_file = done is None
+    if done:
+        grid = list(grid)
+        _check_resume(done, grid, _model(t_max, relativistic), outputfile)
+    else:
+        done = {}
+    todo = ((index, data) for index, data in enumerate(grid)
+            if index not in done)
+    chunks = iter(lambda: list(itertools.islice(todo, chunksize)), [])
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    n_run = 0
+    with open(outputfile, 'w' if new_file else 'a', newline='') as f:
+        writer = csv.writer(f)
+        if new_file:
+            writer.writerow(COLUMNS)
+            f.flush() # a resumed sweep finds the header
+
+        def write(rows):
+            writer.writerows(rows)
+            f.flush() # checkpoint
+            return len(rows)
+
+        if workers == 1:
+            for chunk in chunks:
+                n_run += write(_run_chunk(chunk, t_max, relativistic))
+            return n_run
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(executor.submit(_run_chunk, chunk, t_max,
+                                               relativistic))
+                if len(pending) >= 2*workers: # bound the chunks in flight
+                    n_run += write(pending.popleft().result())
+            while pending:
+                n_run += write(pending.popleft().result())
+    return n_run
+
+def read_results(inputfile):
+    """Return the results table as a dict of arrays (one for each column,
+    float but the error strings), sorted by index.
+    """
+    with open(inputfile, newline='') as f:
+        rows = [row for row in itertools.islice(csv.reader(f), 1, None)
+                if len(row) == len(COLUMNS)]
+    rows.sort(key=lambda row: int(row[0]))
+    table = np.array([row[:-1] for row in rows],
+                     dtype=float).reshape(-1, len(COLUMNS) - 1)
+    results = {name: table[:, i] for i, name in enumerate(COLUMNS[:-1])}
+    results["error"] = np.array([row[-1] for row in rows], dtype=str)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Cyclotron parameter sweep (extraction energy and "
+                    "turn count), resumable.")
+    parser.add_argument('outputfile', help="results table (.csv)")
+    parser.add_argument('values', nargs='*', metavar='name=values',
+                        help="parameter values, name in "
+                             f"{', '.join(cyclotron_engine.DATA_NAMES)}, "
+                             "values as start:stop:num or v1,v2,...")
+    parser.add_argument('-j', '--workers', type=int,
+                        help="worker processes (default one for each CPU)")
+    parser.add_argument('--t-max', type=float,
+                        help="time limit of each simulation (s)")
+    parser.add_argument('--relativistic', action='store_true',
+                        help="relativistic equations of motion")
+    args = parser.parse_args()
+    values = {}
+    for item in args.values:
+        name, _, text = item.partition('=')
+        values[name] = parse_values(text)
+    grid, size = make_grid(**values)
+    n_run = run_sweep(grid, args.outputfile, workers=args.workers,
+                      t_max=args.t_max, relativistic=args.relativistic)
+    print(f"{n_run} settings run, {size - n_run} already in "
+          f"{args.outputfile}")
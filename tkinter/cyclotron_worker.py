@@ -0,0 +1,126 @@
+"""Producer/consumer stepping of the cyclotron animation.
+A worker thread (Producer) integrates the trajectory ahead of the
+animation, one step at a time, and puts the states in a bounded ring
+buffer (StateRing); the Tk loop only takes, at each frame, the states up
+to the time to show, so a slow solve no longer blocks the window: the
+animation waits for the worker instead of piling up delayed frames.
+
+The worker never touches Tk: it only calls a pure solve function
+solve(z0, t, params) -> (x, y, vx, vy) at t[-1].
+"""
+
+import threading
+import numpy as np
+
+class StateRing:
+    """Bounded ring buffer of states (t, x, y, vx, vy), shared by a
+    producer thread (put) and a consumer (pop_until).
+    """
+
+    def __init__(self, capacity=64):
+        self.capacity = capacity
+        self._rows = np.empty((capacity, 5))
+        self._start = 0 # index of the oldest state
+        self._size = 0
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        return self._size
+
+    def put(self, row, abort=None, timeout=0.1):
+        """Append the state row, waiting while the ring is full. Return
+        False without appending if abort() becomes true meanwhile.
+        """
+        with self._cond:
+            while self._size == self.capacity:
+                if abort is not None and abort():
+                    return False
+                self._cond.wait(timeout)
+            if abort is not None and abort():
+                return False
+            self._rows[(self._start + self._size) % self.capacity] = row
+            self._size += 1
+            return True
+
+    def pop_until(self, t):
+        """Remove and return the states with time <= t, oldest first, as
+        an array of shape (n, 5).
+        """
+        with self._cond:
+            index = (self._start + np.arange(self._size)) % self.capacity
+            rows = self._rows[index]
+            n = int(np.searchsorted(rows[:, 0], t, side='right'))
+            self._start = (self._start + n) % self.capacity
+            self._size -= n
+            if n:
+                self._cond.notify_all()
+            return rows[:n]
+
+    def newest_time(self):
+        """Return the time of the newest state, None if empty."""
+        with self._cond:
+            if self._size == 0:
+                return None
+            return self._rows[(self._start + self._size - 1)
+                              % self.capacity, 0]
+
+    def clear(self):
+        """Remove all the states."""
+        with self._cond:
+            self._size = 0
+            self._cond.notify_all()
+
+
+class Producer(threading.Thread):
+    """Worker thread integrating ahead into a StateRing.
+    - solve -- solve(z0, t, params), return the state at t[-1]
+    - t0, z0 -- initial time and state (x, y, vx, vy)
+    - get_step -- function returning the time step (s) of the next state
+    - get_params -- function returning the params of the next step
+    - capacity -- states buffered ahead of the animation
+    """
+
+    def __init__(self, solve, t0, z0, get_step, get_params, capacity=64):
+        super().__init__(daemon=True)
+        self.solve = solve
+        self.get_step = get_step
+        self.get_params = get_params
+        self.ring = StateRing(capacity)
+        self.error = None # exception raised by solve, if any
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._state = (t0, tuple(z0))
+        self._generation = 0 # incremented by reset
+
+    def run(self):
+        while not self._stop_event.is_set():
+            with self._lock:
+                (t, z), generation = self._state, self._generation
+            dt = self.get_step()
+            try:
+                z = tuple(self.solve(z, np.array([t, t + dt]),
+                                     self.get_params()))
+            except Exception as error: # reported to the consumer
+                self.error = error
+                return
+            with self._lock:
+                if generation != self._generation: # reset meanwhile
+                    continue
+                self._state = (t + dt, z)
+            # not put after a reset or stop (or cleared by the reset)
+            self.ring.put((t + dt,) + z, lambda: (
+                self._stop_event.is_set() or generation != self._generation))
+
+    def reset(self, t0, z0):
+        """Restart the integration from time t0 and state z0, discarding
+        the buffered states (e.g. after a change of the parameters).
+        """
+        with self._lock:
+            self._state = (t0, tuple(z0))
+            self._generation += 1
+        self.ring.clear()
+
+    def stop(self):
+        """Stop the thread (it ends after the step in progress)."""
+        self._stop_event.set()
+        self.ring.clear()
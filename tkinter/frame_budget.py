@@ -0,0 +1,109 @@
+"""Frame time budget of the animations.
+StepBudget chooses, frame by frame, how the differential equations of a
+frame are solved so that the solve fits a time budget: the frame interval
+dt is split in substeps no longer than a maximum step (e.g. half the time
+to cross the gap, so the solver cannot step over it), the cost of a
+substep is measured, and when the substeps of dt would not fit the
+budget the frame solves only the whole substeps that fit (frame_step):
+the animation runs slower than its timescale but on time, and the
+substeps are never made longer than the maximum step (the solver would
+step over the gap). The tolerance is also loosened when over the budget
+and tightened back when well under it.
+
+FrameMeter measures the achieved frame rate and the rate of delayed
+frames over the last frames, for the monitors.
+
+Example:
+    budget = StepBudget(0.5 * frame_interval)
+    dt = budget.frame_step(dt, max_step)
+    n = budget.substeps(dt, max_step)
+    ... solve with n substeps and rtol=budget.rtol in seconds ...
+    budget.update(seconds, n)
+"""
+
+import math
+from collections import deque
+import time
+
+class StepBudget:
+    """Substeps and tolerance of the solve of a frame within a budget.
+    - budget -- time (s) allowed to the solve of a frame
+    - rtol -- tightest relative tolerance (default the one of odeint)
+    - rtol_max -- loosest relative tolerance
+    - smoothing -- weight of the last frame in the mean cost of a substep
+    """
+
+    def __init__(self, budget, rtol=1.49012e-8, rtol_max=1e-4,
+                 smoothing=0.2):
+        self.budget = budget
+        self.rtol_min = rtol
+        self.rtol_max = rtol_max
+        self.smoothing = smoothing
+        self.rtol = rtol # tolerance of the next frame
+        self.cost = None # mean cost (s) of a substep
+
+    def substeps(self, dt, max_step):
+        """Return the number of substeps of a frame of dt (s), the fewest
+        no longer than max_step, whatever the budget (a frame too slow at
+        the loosest tolerance is late rather than less accurate).
+        """
+        return max(math.ceil(abs(dt) / max_step), 1)
+
+    def frame_step(self, dt, max_step):
+        """Return the time (s) to solve in a frame of dt: dt, or the whole
+        substeps of max_step that fit the budget at the measured cost of a
+        substep (at least one) if those of dt do not.
+        """
+        if (self.cost is None
+            or self.substeps(dt, max_step) * self.cost <= self.budget):
+            return dt
+        n = max(int(self.budget / self.cost), 1)
+        return math.copysign(min(n*max_step, abs(dt)), dt)
+
+    def update(self, seconds, n):
+        """Record that the solve of a frame in n substeps took seconds, and
+        adjust the tolerance of the next frame.
+        """
+        cost = seconds / n
+        if self.cost is None:
+            self.cost = cost
+        else:
+            self.cost += self.smoothing * (cost - self.cost)
+        if seconds > self.budget and self.rtol < self.rtol_max:
+            self.rtol = min(self.rtol * 10, self.rtol_max)
+        elif seconds < self.budget / 4 and self.rtol > self.rtol_min:
+            self.rtol = max(self.rtol / 10, self.rtol_min)
+
+
+class FrameMeter:
+    """Achieved frame rate and delayed frames over the last window frames."""
+
+    def __init__(self, window=100):
+        self._times = deque(maxlen=window + 1)
+        self._delayed = deque(maxlen=window)
+
+    def tick(self, delayed=False, now=None):
+        """Record a frame (delayed if it missed its time) at time now (s,
+        default time.perf_counter()).
+        """
+        self._times.append(time.perf_counter() if now is None else now)
+        self._delayed.append(bool(delayed))
+
+    def reset(self):
+        """Forget the frames (e.g. on pause)."""
+        self._times.clear()
+        self._delayed.clear()
+
+    @property
+    def fps(self):
+        """Frames per second over the window, None before two frames."""
+        if len(self._times) < 2 or self._times[-1] == self._times[0]:
+            return None
+        return (len(self._times) - 1) / (self._times[-1] - self._times[0])
+
+    @property
+    def delayed_rate(self):
+        """Fraction of delayed frames over the window, None before a frame."""
+        if not self._delayed:
+            return None
+        return sum(self._delayed) / len(self._delayed)
@@ -0,0 +1,122 @@
+"""Non-blocking frame scheduler for the tkinter demo animations.
+The demos used to draw the frames in a for loop with canvas.update() and a
+blocking canvas.after(dt), so a slow frame delayed all the following ones
+and the window froze between frames. FrameScheduler instead schedules each
+frame with widget.after() against its deadline t0 + k/fps, inside the Tk
+mainloop: the wait is shortened by the time the frame took, and when a
+frame is late the frames whose deadline has already passed are dropped
+(the animation stays on time instead of slowing down).
+
+The timing statistics of a run (mean, p95 and p99 frame time, dropped
+frames, given and actual running time) are written as one JSON record to
+the "frame_scheduler" logger, e.g. for UI load tests.
+
+Example:
+    scheduler = FrameScheduler(canvas, fps=24, draw=draw, n_frames=240,
+                               name="demo")
+    scheduler.start()
+    window.mainloop()
+"""
+
+import json
+import logging
+import math
+import time
+import numpy as np
+
+logger = logging.getLogger("frame_scheduler")
+
+class FrameScheduler:
+    """Deadline based scheduler of the frames of an animation.
+    - widget -- any tkinter widget (its after method is used)
+    - fps -- target frame rate (frame/s)
+    - draw -- function draw(k) drawing the frame of index k (time k/fps
+    from the start); dropped frames are skipped, so the index can advance
+    by more than one
+    - n_frames -- number of frames of the run (None to run until stop)
+    - on_done -- function called at the end of the run
+    - name -- name of the run in the log record
+    """
+
+    def __init__(self, widget, fps, draw, n_frames=None, on_done=None,
+                 name="animation"):
+        self.widget = widget
+        self.fps = fps
+        self.draw = draw
+        self.n_frames = n_frames
+        self.on_done = on_done
+        self.name = name
+        self.frame_times = [] # time (s) taken by each drawn frame
+        self.dropped = 0 # frames skipped because late
+        self.running = False
+        self._job = None
+        self._t0 = self._t_end = None # start and end (s) of the run
+
+    def start(self):
+        """Start the run: the first frame is drawn at once."""
+        self.frame_times = []
+        self.dropped = 0
+        self.running = True
+        self._t0 = time.perf_counter()
+        self._next = 0 # index of the next frame
+        self._job = self.widget.after(0, self._tick)
+
+    def stop(self):
+        """Stop the run and log its statistics."""
+        if not self.running:
+            return
+        self.running = False
+        if self._job is not None:
+            self.widget.after_cancel(self._job)
+            self._job = None
+        self._t_end = time.perf_counter()
+        logger.info(json.dumps(self.stats()))
+        if self.on_done is not None:
+            self.on_done()
+
+    def _tick(self):
+        """Draw the due frame and schedule the next one."""
+        self._job = None
+        if not self.running:
+            return
+        t1 = time.perf_counter()
+        # latest frame whose deadline has passed, the ones before dropped
+        due = max(int((t1 - self._t0) * self.fps), self._next)
+        if self.n_frames is not None:
+            due = min(due, self.n_frames - 1)
+        self.dropped += due - self._next
+        self.draw(due)
+        self.widget.update_idletasks()
+        t2 = time.perf_counter()
+        self.frame_times.append(t2 - t1)
+        self._next = due + 1
+        if self.n_frames is not None and self._next >= self.n_frames:
+            self.stop()
+            return
+        wait = self._t0 + self._next / self.fps - t2
+        self._job = self.widget.after(max(math.ceil(wait * 1000), 0),
+                                      self._tick)
+
+    def stats(self):
+        """Return the timing statistics of the run (times in ms, running
+        time None before start).
+        """
+        frame_times = np.array(self.frame_times) * 1000
+        end = self._t_end if not self.running else time.perf_counter()
+        running_time = end - self._t0 if self._t0 is not None else None
+        if len(frame_times):
+            mean, p95, p99 = (float(np.mean(frame_times)),
+                              *np.percentile(frame_times, [95, 99]).tolist())
+        else:
+            mean = p95 = p99 = None
+        return {"name": self.name,
+                "fps": self.fps,
+                "frames": len(frame_times),
+                "dropped": self.dropped,
+                "mean_ms": mean,
+                "p95_ms": p95,
+                "p99_ms": p99,
+                "given_running_time_s": (self.n_frames / self.fps
+                                         if self.n_frames is not None
+                                         else None),
+                "running_time_s": running_time}
@@ -5,12 +5,18 @@ import numpy as np
 from scipy.integrate import odeint, solve_ivp
 from scipy import signal
 import time
+import cyclotron_fields
 
 def derive(t, z, params):
     """Compute the derivative of input z (tuple containing x, y, vx, vy)
     at time t.
     params contains: charge, mass, B field, E field, gap size, dee radius.
+    z can also be a solution array (N, 4) with t of shape (N,): then all
+    the derivatives (N, 4) are computed at once (see
+    cyclotron_fields.derive_array).
     """
+    if np.ndim(z) > 1:
+        return cyclotron_fields.derive_array(t, z, params)
     x, y, vx, vy = z
     q, m, B, E, gap, d_r = params
     if ( # inside one of the dees, E_field = 0
@@ -69,11 +75,7 @@ vy = sol[:, 3]
 v = np.sqrt(vx**2 + vy**2)
 R = (m*v) / (q*B)
 
-ax = np.zeros(x.shape)
-ay = np.zeros(y.shape)
-
-for i in range(len(x)):
-    _, _, ax[i], ay[i] = derive(t[i], sol[i,:], params)
+_, _, ax, ay = derive(t, sol, params).T
 
 plt.figure()
 
@@ -0,0 +1,123 @@
+"""Bounded track of a moving object on a tkinter Canvas.
+Drawing a new line item for every frame fills the canvas with hundreds of
+thousands of items and slows every redraw. TrackLayer keeps the track in a
+few polyline items instead: the newest one grows through coords(), and
+when it reaches chunk_size points it is frozen and a new one is started.
+Points closer than min_step pixels to the previous one only move the end
+of the track (decimation of sub-pixel segments), and the oldest items are
+deleted beyond max_points, so the number of items, the cost of a frame
+and the memory stay flat in long sessions.
+
+Example:
+    track = TrackLayer(canvas, max_points=20000)
+    track.add(x, y, "red") # every frame
+"""
+
+import math
+
+class TrackLayer:
+    """Track of polylines on a canvas.
+    - canvas -- the tkinter Canvas
+    - max_points -- maximum number of points kept (None for no limit),
+    the oldest polylines are deleted beyond it
+    - min_step -- minimum distance (pixel) between two kept points
+    - chunk_size -- points of each polyline item
+    - options -- further create_line options (e.g. width)
+    """
+
+    def __init__(self, canvas, max_points=20000, min_step=1.0,
+                 chunk_size=512, **options):
+        self.canvas = canvas
+        self.max_points = max_points
+        self.min_step = min_step
+        self.chunk_size = chunk_size
+        self.options = options
+        self._frozen = [] # (item, number of points) of the full polylines
+        self._n_frozen = 0 # points in the frozen polylines
+        self._item = None # growing polyline
+        self._coords = [] # x0, y0, x1, y1, ... of the growing polyline
+        self._color = None
+        self._moved = False # last point is a provisional end (< min_step)
+        self._last = [] # last point of the last frozen polyline
+
+    def __len__(self):
+        """Number of points kept."""
+        return self._n_frozen + len(self._coords)//2
+
+    @property
+    def n_items(self):
+        """Number of canvas items of the track."""
+        return len(self._frozen) + (self._item is not None)
+
+    def add(self, x, y, color="black"):
+        """Add the point x, y (canvas coordinates) to the track."""
+        self._append(x, y, color)
+        self._draw()
+        self._trim()
+
+    def extend(self, xs, ys, color="black"):
+        """Add the points xs, ys (canvas coordinates) to the track, with a
+        single update of the canvas.
+        """
+        for x, y in zip(xs, ys):
+            self._append(x, y, color)
+        self._draw()
+        self._trim()
+
+    def clear(self):
+        """Delete the track from the canvas."""
+        for item, _ in self._frozen:
+            self.canvas.delete(item)
+        if self._item is not None:
+            self.canvas.delete(self._item)
+        self._frozen = []
+        self._n_frozen = 0
+        self._item = None
+        self._coords = []
+        self._moved = False
+
+    def _append(self, x, y, color):
+        """Append a point to the growing polyline, without drawing it."""
+        coords = self._coords
+        if color != self._color and coords:
+            # new polyline of the new color, starting at the last point
+            self._freeze()
+            coords = self._coords = self._last[:]
+        self._color = color
+        if len(coords) >= 4 and self._moved:
+            del coords[-2:] # replace the provisional end
+        self._moved = bool(coords) and (
+            math.hypot(x - coords[-2], y - coords[-1]) < self.min_step)
+        coords += (x, y)
+        if len(coords) >= 2*self.chunk_size and not self._moved:
+            self._freeze()
+            self._coords = self._last[:]
+
+    def _draw(self):
+        """Update the growing polyline on the canvas."""
+        if len(self._coords) >= 4:
+            if self._item is None:
+                self._item = self.canvas.create_line(
+                    *self._coords, fill=self._color, **self.options)
+            else:
+                self.canvas.coords(self._item, self._coords)
+
+    def _freeze(self):
+        """Freeze the growing polyline and keep its last point."""
+        self._draw()
+        self._last = self._coords[-2:]
+        if self._item is not None:
+            self._frozen.append((self._item, len(self._coords)//2))
+            self._n_frozen += len(self._coords)//2
+        self._item = None
+        self._coords = []
+        self._moved = False
+
+    def _trim(self):
+        """Delete the oldest polylines beyond max_points."""
+        if self.max_points is None:
+            return
+        while self._frozen and len(self) > self.max_points:
+            item, n = self._frozen.pop(0)
+            self.canvas.delete(item)
+            self._n_frozen -= n